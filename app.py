@@ -1,11 +1,9 @@
 import os
 import sys
 import time
-import base64
+import zipfile
 import numpy as np
 import streamlit as st
-from tensorflow.keras.models import load_model
-from PIL import Image
 
 # =========================
 # ✅ Set Project Path
@@ -17,30 +15,59 @@ if project_root not in sys.path:
 # =========================
 # ✅ Load Trained Model
 # =========================
-model_path = os.path.join(project_root, "models/final_model.h5")
-try:
-    model = load_model(model_path, compile=False)
-except Exception as e:
-    st.error(f"Error loading model: {e}")
-    st.stop()
+from utils.model_cache import get_model, model_stats, model_version, preload
+from utils.inference import (load_study_slice, read_zip_members, study_slice_names, submit_prediction,
+                             summarize_study)
+from utils.data_loader import array_digest
+from utils.embedding_index import embed, get_index, save_in_background
+from utils.gradcam import explain, overlay
+from utils.preprocessing import IMAGE_EXTENSIONS
+from utils.volume_reader import DICOM_EXTENSIONS, DICOM_SERIES_EXTENSION, NIFTI_EXTENSIONS
+from utils.upload_store import get_configured_upload_store
+from utils.record_store import get_record_store, new_id
+from utils.instrumentation import recent, stage, summary
+from utils.prediction_cache import prediction_cache
+from utils.startup import background_css, first_render_seconds, mark_first_render
+
+# PCD_MODEL_PATH selects the backend, e.g. models/final_model_int8.tflite for CPU-only boxes
+model_path = os.environ.get("PCD_MODEL_PATH", os.path.join(project_root, "models/final_model.h5"))
+# PCD_TTA_VIEWS > 1 averages that many augmented views per slice (one batched predict)
+tta_views = int(os.environ.get("PCD_TTA_VIEWS", 1))
+# PCD_EARLY_EXIT=1 scores long studies coarse-to-fine and stops once the decision is settled
+early_exit = os.environ.get("PCD_EARLY_EXIT", "0") == "1"
+# Similar-case index built by build_index.py; the section is hidden until it exists
+index_path = os.environ.get("PCD_INDEX_PATH", os.path.join(project_root, "models/embedding_index.npz"))
+# Grad-CAM heatmaps for the PCD_GRADCAM_SLICES most suspicious slices (0 disables), computed
+# within PCD_GRADCAM_BUDGET seconds per page view; anything left over is shown on the next view
+gradcam_slices = int(os.environ.get("PCD_GRADCAM_SLICES", 4))
+gradcam_budget = float(os.environ.get("PCD_GRADCAM_BUDGET", 2.0))
+# Uploads are stored once per distinct content and evicted by age, then by total size
+upload_store = get_configured_upload_store(os.path.join(project_root, "uploads", "store"))
+# PCD_PRELOAD_MODEL: "background" (default) loads the model on a thread right after login,
+# "eager" before the first page renders (the old startup), "off" on the first inference
+preload_mode = os.environ.get("PCD_PRELOAD_MODEL", "background")
+# Patients, uploaded scans and predictions, written in the background; the history page
+# shows PCD_HISTORY_PAGE_SIZE records per page
+record_store = get_record_store(os.environ.get("PCD_RECORDS_PATH", os.path.join(project_root, "records", "records.db")))
+history_page_size = int(os.environ.get("PCD_HISTORY_PAGE_SIZE", 50))
+
+def load_model():
+    # Only pages that run inference call this, so welcome/login never wait for TensorFlow.
+    # Loaded and warmed up once per process, shared across sessions.
+    try:
+        return get_model(model_path)
+    except Exception as e:
+        st.error(f"Error loading model: {e}")
+        st.stop()
+
+if preload_mode == "eager":
+    load_model()
 
 # =========================
 # 🎨 Set Background Image
 # =========================
 def set_background(image_file):
-    with open(image_file, "rb") as f:
-        encoded_string = base64.b64encode(f.read()).decode()
-    bg_image = f"""
-    <style>
-    .stApp {{
-        background-image: url("data:image/jpg;base64,{encoded_string}");
-        background-size: cover;
-        background-position: center;
-        background-repeat: no-repeat;
-    }}
-    </style>
-    """
-    st.markdown(bg_image, unsafe_allow_html=True)
+    st.markdown(background_css(image_file), unsafe_allow_html=True)  # encoded once per process
 
 background_image_path = os.path.join(project_root, "background.jpg")
 set_background(background_image_path)
@@ -52,25 +79,58 @@ if "page" not in st.session_state:
     st.session_state["page"] = "welcome"
 if "authenticated" not in st.session_state:
     st.session_state["authenticated"] = False
-if "uploaded_image" not in st.session_state:
-    st.session_state["uploaded_image"] = None
+if "slice_names" not in st.session_state:
+    st.session_state["slice_names"] = []
 if "patient_details" not in st.session_state:
     st.session_state["patient_details"] = {}
+if "prediction_future" not in st.session_state:
+    st.session_state["prediction_future"] = None
+if "predictions" not in st.session_state:
+    st.session_state["predictions"] = None
+if "study_sources" not in st.session_state:
+    st.session_state["study_sources"] = ([], [])
+if "study_names" not in st.session_state:
+    st.session_state["study_names"] = ([], [])
+if "similar_cases" not in st.session_state:
+    st.session_state["similar_cases"] = None
+if "gradcam_inputs" not in st.session_state:
+    st.session_state["gradcam_inputs"] = None
+if "patient_id" not in st.session_state:
+    st.session_state["patient_id"] = None
+if "study_id" not in st.session_state:
+    st.session_state["study_id"] = None
+if "history_cursors" not in st.session_state:
+    st.session_state["history_cursors"] = [None]  # keyset cursor of every page visited so far
+if "history_filters" not in st.session_state:
+    st.session_state["history_filters"] = {}
+
+# =========================
+# 📊 Admin Metrics & History Links
+# =========================
+if st.session_state["authenticated"] and st.session_state["page"] not in ("admin", "history"):
+    if st.sidebar.button("📊 Admin Metrics"):
+        st.session_state["return_page"] = st.session_state["page"]
+        st.session_state["page"] = "admin"
+        st.rerun()
+    if st.sidebar.button("🗂️ Diagnosis History"):
+        st.session_state["return_page"] = st.session_state["page"]
+        st.session_state["page"] = "history"
+        st.session_state["history_cursors"] = [None]
+        st.rerun()
 
 # =========================
 # 🏠 Welcome Page
 # =========================
+# Shown once, above the login form in the same run; no wait and no extra click
 if st.session_state["page"] == "welcome":
     st.title("👋 Welcome to Medical Diagnosis App")
     st.write("This application helps in detecting Pancreatic Cancer using AI.")
-    time.sleep(3)
     st.session_state["page"] = "login"
-    st.rerun()
 
 # =========================
 # 🔐 Login Page
 # =========================
-elif st.session_state["page"] == "login":
+if st.session_state["page"] == "login":
     st.title("🔐 User Login")
     username = st.text_input("Enter Username")
     password = st.text_input("Enter Password", type="password", help="Default: admin/1234")
@@ -78,8 +138,9 @@ elif st.session_state["page"] == "login":
     if st.button("Login"):
         if username == "admin" and password == "1234":
             st.session_state["authenticated"] = True
+            if preload_mode == "background":
+                preload(model_path)  # warm by the time the first scan is uploaded
             st.success("Login Successful ✅")
-            time.sleep(1)
             st.session_state["page"] = "patient_details"
             st.rerun()
         else:
@@ -91,15 +152,26 @@ elif st.session_state["page"] == "login":
 # =========================
 elif st.session_state["page"] == "patient_details":
     st.title("🩺 Enter Patient Details")
+    # Coming back here edits the current patient (same id, its record is replaced);
+    # "New Patient" starts a separate record
+    details = st.session_state["patient_details"]
+    if st.session_state["patient_id"] is not None and st.button("➕ New Patient"):
+        st.session_state["patient_id"] = None
+        st.session_state["patient_details"] = {}
+        st.rerun()
+    genders = ["Male", "Female", "Other"]
+    blood_groups = ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"]
     with st.form("patient_details_form"):
-        name = st.text_input("Full Name")
-        age = st.number_input("Age", min_value=1, max_value=120)
-        gender = st.selectbox("Gender", ["Male", "Female", "Other"])
-        blood_group = st.selectbox("Blood Group", ["A+", "A-", "B+", "B-", "O+", "O-", "AB+", "AB-"])
-        height = st.number_input("Height (cm)", min_value=50, max_value=250)
-        weight = st.number_input("Weight (kg)", min_value=20, max_value=200)
-        smoking = st.selectbox("Smoking History", ["Yes", "No"])
-        family_history = st.selectbox("Family History of Cancer", ["Yes", "No"])
+        name = st.text_input("Full Name", value=details.get("Name", ""))
+        age = st.number_input("Age", min_value=1, max_value=120, value=details.get("Age", 1))
+        gender = st.selectbox("Gender", genders, index=genders.index(details.get("Gender", "Male")))
+        blood_group = st.selectbox("Blood Group", blood_groups,
+                                   index=blood_groups.index(details.get("Blood Group", "A+")))
+        height = st.number_input("Height (cm)", min_value=50, max_value=250, value=details.get("Height", 50))
+        weight = st.number_input("Weight (kg)", min_value=20, max_value=200, value=details.get("Weight", 20))
+        smoking = st.selectbox("Smoking History", ["Yes", "No"], index=["Yes", "No"].index(details.get("Smoking", "Yes")))
+        family_history = st.selectbox("Family History of Cancer", ["Yes", "No"],
+                                      index=["Yes", "No"].index(details.get("Family History", "Yes")))
         submit = st.form_submit_button("Next")
 
     if submit:
@@ -108,8 +180,9 @@ elif st.session_state["page"] == "patient_details":
             "Blood Group": blood_group, "Height": height,
             "Weight": weight, "Smoking": smoking, "Family History": family_history
         }
+        st.session_state["patient_id"] = record_store.add_patient(st.session_state["patient_details"],
+                                                                  patient_id=st.session_state["patient_id"])
         st.success("Details Saved ✅")
-        time.sleep(1)
         st.session_state["page"] = "upload_image"
         st.rerun()
         
@@ -117,17 +190,74 @@ elif st.session_state["page"] == "patient_details":
 # 📷 Image Upload Page
 # =========================
 elif st.session_state["page"] == "upload_image":
-    st.title("📷 Upload CT Scan Image")
-    uploaded_file = st.file_uploader("Upload a CT Scan Image", type=["jpg", "png", "jpeg"])
-    if uploaded_file:
-        uploads_dir = os.path.join(project_root, "uploads")
-        os.makedirs(uploads_dir, exist_ok=True)
-        image_path = os.path.join(uploads_dir, uploaded_file.name)
-        with open(image_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        st.session_state["uploaded_image"] = image_path
-        st.success("Image uploaded successfully!")
-        time.sleep(1)
+    st.title("📷 Upload CT Scan Images")
+    uploaded_files = st.file_uploader(
+        "Upload CT Scans (JPG/PNG slices, a NIfTI volume, DICOM files, or a .zip of a study)",
+        type=["jpg", "png", "jpeg", "zip", "nii", "gz", "dcm"], accept_multiple_files=True)
+    if uploaded_files and st.button(f"Analyze {len(uploaded_files)} file(s)"):
+        # (original name, StoredBlob); blobs are written in the background while the
+        # in-memory bytes go straight to preprocessing
+        images, volumes, dicom_slices = [], [], []
+        # Each blob is pinned as it is stored, so it stays on disk while the study is processed
+        # and shown; the previous study of this session is released
+        upload_store.unpin(st.session_state.get("upload_pin"))
+        pin = st.session_state["upload_pin"] = upload_store.pin()
+        with stage("upload_store", files=len(uploaded_files)):
+            for uploaded_file in uploaded_files:
+                name = uploaded_file.name.lower()
+                if name.endswith(".zip"):
+                    try:
+                        members = read_zip_members(uploaded_file)
+                        dicom_members = read_zip_members(uploaded_file, DICOM_EXTENSIONS)
+                    except (ValueError, zipfile.BadZipFile) as e:
+                        st.error(f"Could not read {uploaded_file.name}: {e} ❌")
+                        st.stop()
+                    images += [(member, upload_store.put(data, os.path.splitext(member)[1], pin=pin))
+                               for member, data in members]
+                    dicom_slices += [(member, upload_store.put(data, ".dcm", pin=pin)) for member, data in dicom_members]
+                elif name.endswith(DICOM_EXTENSIONS):
+                    dicom_slices.append((uploaded_file.name, upload_store.put(uploaded_file.getbuffer(), ".dcm", pin=pin)))
+                elif name.endswith(NIFTI_EXTENSIONS):
+                    # scored slice by slice, never exported to JPEG
+                    extension = ".nii.gz" if name.endswith(".gz") else ".nii"
+                    volumes.append((uploaded_file.name, upload_store.put(uploaded_file.getbuffer(), extension, pin=pin)))
+                elif name.endswith(IMAGE_EXTENSIONS):
+                    images.append((uploaded_file.name,
+                                   upload_store.put(uploaded_file.getbuffer(), os.path.splitext(name)[1], pin=pin)))
+                else:
+                    # e.g. a .gz that is not a .nii.gz
+                    st.warning(f"Skipped {uploaded_file.name}: not a supported scan format")
+            if dicom_slices:
+                # The series itself is a content-addressed manifest of its slice blobs
+                manifest = "\n".join(sorted({blob.path for _, blob in dicom_slices}))
+                volumes.append(("DICOM series", upload_store.put_text(manifest, DICOM_SERIES_EXTENSION, pin=pin)))
+
+        if not images and not volumes:
+            st.error("No CT images or volumes found in the upload! ❌")
+            st.stop()
+
+        # Inference starts now, in the background; the processing page only waits for it.
+        # Volumes are read from disk, so inference first waits for the pending writes.
+        model = load_model()
+        st.session_state["prediction_future"] = submit_prediction(
+            model, [blob.data for _, blob in images], model_version=model_version(model_path),
+            tta_views=tta_views, volume_paths=[blob.path for _, blob in volumes], early_exit=early_exit,
+            image_hashes=[blob.digest for _, blob in images], volume_hashes=[blob.digest for _, blob in volumes],
+            pending_writes=[blob.write for _, blob in images + volumes + dicom_slices])
+        st.session_state["predictions"] = None
+        st.session_state["study_sources"] = ([blob.path for _, blob in images], [blob.path for _, blob in volumes])
+        st.session_state["study_names"] = ([name for name, _ in images], [name for name, _ in volumes])
+        st.session_state["similar_cases"] = None
+        st.session_state["gradcam_inputs"] = None
+        st.session_state["study_id"] = new_id()
+        record_store.add_scans(st.session_state["study_id"],
+                               [{"kind": "image", "name": name, "digest": blob.digest, "path": blob.path}
+                                for name, blob in images] +
+                               [{"kind": "volume", "name": name, "digest": blob.digest, "path": blob.path}
+                                for name, blob in volumes] +
+                               [{"kind": "dicom", "name": name, "digest": blob.digest, "path": blob.path}
+                                for name, blob in dicom_slices])
+        st.success(f"{len(images) + len(volumes)} scan(s) uploaded successfully!")
         st.session_state["page"] = "processing"
         st.rerun()
         
@@ -137,7 +267,29 @@ elif st.session_state["page"] == "upload_image":
 elif st.session_state["page"] == "processing":
     st.title("🔄 Processing Image...")
     st.write("Analyzing the image using deep learning model...")
-    time.sleep(3)
+    future = st.session_state.get("prediction_future")
+    if future is None:
+        st.session_state["page"] = "upload_image"
+        st.rerun()
+
+    # Returns as soon as the background prediction completes
+    with st.spinner("Running model..."), stage("wait_for_inference"):
+        try:
+            st.session_state["predictions"] = future.result()
+            st.session_state["slice_names"] = study_slice_names(*st.session_state["study_sources"],
+                                                                *st.session_state["study_names"])
+            # Queued, so the result page doesn't wait for the database
+            record_store.add_prediction(st.session_state["study_id"], st.session_state["patient_id"],
+                                        summarize_study(st.session_state["predictions"]),
+                                        st.session_state["predictions"], model_version(model_path))
+        except Exception as e:
+            st.error(f"Error analyzing image: {e}")
+            if st.button("🔄 Upload Another Image"):
+                st.session_state["page"] = "upload_image"
+                st.rerun()
+            st.stop()
+
+    st.session_state["prediction_future"] = None
     st.session_state["page"] = "result"
     st.rerun()
 
@@ -145,6 +297,11 @@ elif st.session_state["page"] == "processing":
 # 📝 Result Page
 # =========================
 elif st.session_state["page"] == "result":
+    if st.session_state["predictions"] is None:
+        # No finished study in this session (e.g. a new upload is still pending)
+        st.session_state["page"] = "upload_image"
+        st.rerun()
+
     st.title("📝 Diagnosis Result")
 
     # Show patient details
@@ -152,20 +309,16 @@ elif st.session_state["page"] == "result":
     for key, value in st.session_state["patient_details"].items():
         st.write(f"**{key}:** {value}")
 
-    # Preprocess image
-    image_path = st.session_state["uploaded_image"]
-    image = Image.open(image_path).resize((224, 224))
-    image = np.array(image)
-
-    if image.ndim == 2:
-        image = np.stack([image] * 3, axis=-1)
-    elif image.shape[2] == 4:
-        image = image[:, :, :3]
-
-    image = image / 255.0
-    image = np.expand_dims(image, axis=0)
-
-    prediction = model.predict(image)[0][0]
+    # Computed once on the processing page; reruns of this page reuse it
+    predictions = st.session_state["predictions"]
+    study = summarize_study(predictions)
+    if study["max_probability"] is None:
+        st.error("None of the uploaded slices could be scored! ❌")
+        if st.button("🔄 Upload Another Image"):
+            st.session_state["page"] = "upload_image"
+            st.rerun()
+        st.stop()
+    prediction = study["max_probability"]  # the study is scored by its most suspicious slice
     result = "Cancer Detected 😞" if prediction > 0.5 else "No Cancer Detected 😊"
     confidence = prediction * 100 if prediction > 0.5 else (1 - prediction) * 100
 
@@ -174,6 +327,65 @@ elif st.session_state["page"] == "result":
     st.subheader("Model Confidence:")
     st.write(f"**{confidence:.2f}%**")
 
+    if study["num_slices"] > 1:
+        st.subheader("Study Summary:")
+        st.write(f"**{study['num_positive']}** of **{study['num_slices']}** slices flagged, "
+                 f"mean probability **{study['mean_probability'] * 100:.2f}%**")
+        if study["num_inferred"] < study["num_slices"]:
+            st.write(f"Early exit: **{study['num_inferred']}** of **{study['num_slices']}** slices inferred")
+        st.dataframe([
+            {"Slice": name, "Cancer Probability (%)": None if np.isnan(p) else round(float(p) * 100, 2),
+             "Result": "Not inferred" if np.isnan(p) else "Cancer" if p > 0.5 else "Normal"}
+            for name, p in zip(st.session_state["slice_names"], predictions)
+        ], use_container_width=True)
+
+    model = load_model()
+
+    # Where the model looked, for the most suspicious slices; heatmaps are cached by image
+    # hash and model version, so reruns of this page only redo the overlay
+    if hasattr(model, "layers") and gradcam_slices > 0:
+        # The ranked uint8 slices are decoded once per study, not on every rerun
+        if st.session_state["gradcam_inputs"] is None:
+            ranked = [int(i) for i in np.argsort(-np.nan_to_num(predictions, nan=-1.0))[:gradcam_slices]
+                      if not np.isnan(predictions[i])]
+            st.session_state["gradcam_inputs"] = (ranked, np.stack([
+                np.round(load_study_slice(*st.session_state["study_sources"], i)[0][0] * 255).astype(np.uint8)
+                for i in ranked]))
+        ranked, slices = st.session_state["gradcam_inputs"]
+        heatmaps = explain(model, slices, model_version(model_path), time_budget=gradcam_budget)
+        ready = [k for k, heatmap in enumerate(heatmaps) if heatmap is not None]
+        if ready:
+            st.subheader("Model Attention (Grad-CAM):")
+            overlays = overlay(slices[ready], [heatmaps[k] for k in ready])
+            for column, k, image in zip(st.columns(len(ready)), ready, overlays):
+                column.image(image, channels="BGR", use_column_width=True,
+                             caption=f"{st.session_state['slice_names'][ranked[k]]}: "
+                                     f"{predictions[ranked[k]] * 100:.1f}%")
+
+    # Most similar cases to the most suspicious slice, looked up once per study
+    index = get_index(index_path, model_version(model_path)) if hasattr(model, "layers") else None
+    if index is not None:
+        if st.session_state["similar_cases"] is None:
+            slice_index = int(np.nanargmax(predictions))
+            images, slice_id = load_study_slice(*st.session_state["study_sources"], slice_index)
+            vectors = embed(model, images)
+            st.session_state["similar_cases"] = index.lookup(vectors, k=5)[0]
+            # The scored slice is kept (labelled by its prediction, once per image content) but
+            # lookups only return the labelled corpus, so a study never confirms itself
+            if index.add(vectors, [int(predictions[slice_index] > 0.5)], [slice_id], source="scored",
+                         digests=[array_digest(images)]):
+                save_in_background(index, index_path)
+        st.subheader("Similar Cases:")
+        columns = st.columns(max(len(st.session_state["similar_cases"]), 1))
+        for column, case in zip(columns, st.session_state["similar_cases"]):
+            label = "Cancer" if case["label"] == 1 else "Normal"
+            caption = f"{label}{' (predicted)' if case['source'] == 'scored' else ''}, " \
+                      f"similarity {case['similarity']:.2f}"
+            if os.path.isfile(case["path"]):
+                column.image(case["path"], caption=caption, use_column_width=True)
+            else:
+                column.write(f"{os.path.basename(case['path'])}: {caption}")
+
     if result == "No Cancer Detected 😊":
         future_risk = np.random.randint(10, 90)
         st.subheader("Future Risk Prediction:")
@@ -266,3 +478,94 @@ Staying active improves physical and mental well-being:
     if st.button("🔙 Back to Result"):
         st.session_state["page"] = "result"
         st.rerun()
+
+# =========================
+# 🗂️ Diagnosis History Page
+# =========================
+elif st.session_state["page"] == "history":
+    st.title("🗂️ Diagnosis History")
+    col1, col2 = st.columns(2)
+    name = col1.text_input("Patient Name")
+    outcome = col2.selectbox("Result", ["All", "Cancer Detected", "No Cancer Detected"])
+    filters = {"name": name.strip() or None,
+               "outcome": {"All": None, "Cancer Detected": 1, "No Cancer Detected": 0}[outcome]}
+    if filters != st.session_state["history_filters"]:
+        st.session_state["history_filters"] = filters
+        st.session_state["history_cursors"] = [None]
+
+    # Keyset pagination: each page starts after the last row of the previous one
+    cursors = st.session_state["history_cursors"]
+    rows, next_cursor = record_store.history(history_page_size, cursors[-1], **filters)
+    total = record_store.count(**filters)
+    st.write(f"**{total}** record(s), page **{len(cursors)}** of "
+             f"**{max((total + history_page_size - 1) // history_page_size, 1)}**")
+    if not rows:
+        st.info("No diagnosis records found.")
+    st.dataframe([
+        {"Date": time.strftime("%Y-%m-%d %H:%M", time.localtime(row["created_at"])), "Patient": row["name"],
+         "Age": row["age"], "Gender": row["gender"],
+         "Result": "Cancer Detected" if row["outcome"] else "No Cancer Detected",
+         "Max Probability (%)": None if row["max_probability"] is None else round(row["max_probability"] * 100, 2),
+         "Slices Flagged": f"{row['num_positive']}/{row['num_slices']}"}
+        for row in rows
+    ], use_container_width=True)
+
+    col1, col2, col3 = st.columns(3)
+    if len(cursors) > 1 and col1.button("⬅️ Newer"):
+        cursors.pop()
+        st.rerun()
+    if next_cursor is not None and col2.button("Older ➡️"):
+        cursors.append(next_cursor)
+        st.rerun()
+    if col3.button("🔙 Back"):
+        st.session_state["page"] = st.session_state.get("return_page", "upload_image")
+        st.rerun()
+
+# =========================
+# 📊 Admin Metrics Page
+# =========================
+elif st.session_state["page"] == "admin":
+    st.title("📊 Performance Metrics")
+
+    st.subheader("Model")
+    stats = model_stats(model_path)
+    st.write(f"**Version:** {stats.get('version')}")
+    st.write(f"**Load time:** {stats.get('load_seconds', 0):.2f}s, "
+             f"**warm-up:** {stats.get('warmup_seconds', 0):.2f}s")
+
+    st.subheader("Startup")
+    render_seconds = first_render_seconds("app.py")
+    st.write(f"**First render:** {render_seconds:.2f}s after the first script run started (preload: {preload_mode})"
+             if render_seconds is not None else f"**Preload:** {preload_mode}")
+
+    st.subheader("Prediction Cache")
+    cache_stats = prediction_cache.stats()
+    st.write(f"**Hit rate:** {cache_stats['hit_rate'] * 100:.1f}% "
+             f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+             f"{cache_stats['entries']}/{cache_stats['max_entries']} entries)")
+
+    st.subheader("Upload Store")
+    store_stats = upload_store.usage()
+    st.write(f"**{store_stats['files']}** files, **{store_stats['bytes'] / 2**20:.1f}** of "
+             f"{store_stats['max_bytes'] / 2**20:.0f} MB; {store_stats['deduplicated']} of "
+             f"{store_stats['puts']} uploads deduplicated, {store_stats['evicted']} files evicted")
+
+    st.subheader("Record Store")
+    record_stats = record_store.usage()
+    st.write(f"**{record_stats['written']}** rows written in {record_stats['transactions']} transactions, "
+             f"{record_stats['pending_writes']} pending, {record_stats['failed']} failed; "
+             f"**{record_stats['bytes'] / 2**20:.1f}** MB on disk")
+    if record_stats["last_error"]:
+        st.error(f"Last write error: {record_stats['last_error']}")
+
+    st.subheader("Stage Latency")
+    st.dataframe(summary(), use_container_width=True)
+
+    st.subheader("Recent Stages")
+    st.dataframe(list(reversed(recent(50))), use_container_width=True)
+
+    if st.button("🔙 Back"):
+        st.session_state["page"] = st.session_state.get("return_page", "upload_image")
+        st.rerun()
+
+mark_first_render("app.py", st.session_state["page"])
@@ -0,0 +1,205 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import numpy as np
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.preprocessing import IMAGE_EXTENSIONS, decode_batches, normalize_batch
+from utils.study_scoring import score_study
+from utils.tta import MAX_VIEWS, predict_tta
+from utils.volume_reader import DICOM_EXTENSIONS, NIFTI_EXTENSIONS, iter_slice_batches, open_volume
+
+# Headless batch scoring: walks directories (e.g. data/test/normal, data/test/pancreatic_cancer)
+# or file lists, decodes on a thread pool, predicts in fixed-size batches and appends one
+# row per image to CSV/JSONL as it goes. Re-running skips files already scored in the output;
+# rows without a probability (unreadable, skipped by early exit) are retried and a new row
+# is appended for them, so the last row for a path is the current one.
+# NIfTI files and folders of DICOM files are scored slice by slice ("<volume>#<slice>" rows).
+
+FIELDS = ["path", "label_dir", "probability", "prediction", "error"]
+
+def collect_paths(inputs):
+    # Returns (image paths, volume paths); a folder holding .dcm files is one DICOM series
+    paths, volumes = [], []
+    for item in inputs:
+        if item.startswith("@"):  # @list.txt: one image path per line
+            with open(item[1:]) as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        elif os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in files
+                             if name.lower().endswith(IMAGE_EXTENSIONS))
+                volumes.extend(os.path.join(root, name) for name in files
+                               if name.lower().endswith(NIFTI_EXTENSIONS))
+                if any(name.lower().endswith(DICOM_EXTENSIONS) for name in files):
+                    volumes.append(root)
+        elif item.lower().endswith(NIFTI_EXTENSIONS):
+            volumes.append(item)
+        else:
+            paths.append(item)
+    normalize = lambda items: sorted(dict.fromkeys(os.path.normpath(p) for p in items))
+    return normalize(paths), normalize(volumes)
+
+def _trim_partial_line(output_path):
+    # A run killed mid-write leaves an unterminated last row; drop it so it is rescored and
+    # new rows don't get appended onto it
+    with open(output_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail = b""
+        while size and b"\n" not in tail:
+            start = max(size - 4096, 0)
+            f.seek(start)
+            tail = f.read(size - start) + tail
+            size = start
+        end = size + tail.rfind(b"\n") + 1 if b"\n" in tail else 0
+        if end < f.seek(0, os.SEEK_END):
+            print(f"Dropping a partially written row at the end of {output_path}", file=sys.stderr)
+            f.truncate(end)
+
+def already_scored(output_path):
+    # Paths with a probability in the output; error rows are left out so they are retried
+    if not os.path.exists(output_path):
+        return set()
+    _trim_partial_line(output_path)
+    with open(output_path, newline="") as f:
+        if output_path.endswith(".jsonl"):
+            rows = []
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    if line.strip():
+                        print(f"Skipping an unreadable row in {output_path}: {line[:80]!r}", file=sys.stderr)
+        else:
+            rows = csv.DictReader(f)
+        return {row["path"] for row in rows
+                if isinstance(row, dict) and row.get("path") and row.get("probability") not in (None, "")}
+
+class ResultWriter:
+    def __init__(self, output_path):
+        self.jsonl = output_path.endswith(".jsonl")
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self.file = open(output_path, "a", newline="")
+        if not self.jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.jsonl:
+                self.file.write(json.dumps(row) + "\n")
+            else:
+                self.writer.writerow(row)
+        self.file.flush()  # results survive an interrupted run
+
+    def close(self):
+        self.file.close()
+
+def score(model, paths, writer, batch_size=32, workers=None, threshold=0.5, tta_views=1):
+    scored = 0
+    start = time.perf_counter()
+    for chunk, images in decode_batches(paths, batch_size, workers):
+        ok = [i for i, img in enumerate(images) if img is not None]
+        rows = [{"path": p, "label_dir": os.path.basename(os.path.dirname(p)),
+                 "probability": "", "prediction": "", "error": "unreadable"} for p in chunk]
+
+        if ok:
+            batch = normalize_batch(np.stack([images[i] for i in ok]))
+            if tta_views > 1:
+                probabilities = predict_tta(model, batch, tta_views, batch_size * tta_views)
+            else:
+                probabilities = np.asarray(model.predict_on_batch(batch))[:, 0]
+            for i, probability in zip(ok, probabilities):
+                rows[i].update(probability=round(float(probability), 6),
+                               prediction=int(probability > threshold), error="")
+
+        writer.write(rows)
+        scored += len(chunk)
+        elapsed = time.perf_counter() - start
+        print(f"{scored}/{len(paths)} images, {scored / elapsed:.1f} images/sec", file=sys.stderr)
+
+    return scored, time.perf_counter() - start
+
+def score_volume(model, volume, volume_path, slices, writer, batch_size=32, threshold=0.5, tta_views=1,
+                 early_exit=False):
+    # Slices are decoded lazily, one batch at a time, straight from the volume.
+    # early_exit applies to volumes not started yet; skipped slices get an "early exit" row.
+    label_dir = os.path.basename(os.path.dirname(volume_path))
+    if early_exit and len(slices) == len(volume):
+        def predict_slices(indices):
+            _, batch = next(iter_slice_batches(volume, len(indices), indices))
+            return predict_tta(model, batch, tta_views, len(indices) * tta_views)
+
+        probabilities = score_study(predict_slices, len(volume), batch_size, threshold)["probabilities"]
+        writer.write([{"path": f"{volume_path}#{z}", "label_dir": label_dir, "probability": "",
+                       "prediction": "", "error": "skipped (early exit)"} if np.isnan(p) else
+                      {"path": f"{volume_path}#{z}", "label_dir": label_dir, "probability": round(float(p), 6),
+                       "prediction": int(p > threshold), "error": ""}
+                      for z, p in enumerate(probabilities)])
+        return int((~np.isnan(probabilities)).sum())
+
+    for indices, batch in iter_slice_batches(volume, batch_size, slices):
+        probabilities = predict_tta(model, batch, tta_views, batch_size * tta_views)
+        writer.write([{"path": f"{volume_path}#{z}", "label_dir": label_dir,
+                       "probability": round(float(p), 6), "prediction": int(p > threshold), "error": ""}
+                      for z, p in zip(indices, probabilities)])
+    return len(slices)
+
+def main():
+    parser = argparse.ArgumentParser(description="Score CT images with the trained model")
+    parser.add_argument("inputs", nargs="+", help="image files, directories, or @file lists")
+    parser.add_argument("--model", default=os.path.join(project_root, "models/final_model.h5"))
+    parser.add_argument("--output", default="scores.csv", help=".csv or .jsonl, appended to incrementally")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="decode threads (default: CPU based)")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--tta-views", type=int, default=1, choices=range(1, MAX_VIEWS + 1),
+                        metavar=f"1-{MAX_VIEWS}", help="test-time augmentation views per image")
+    parser.add_argument("--early-exit", action="store_true",
+                        help="score volumes coarse-to-fine and stop once the study decision is settled")
+    parser.add_argument("--no-resume", action="store_true", help="rescore files already in the output")
+    args = parser.parse_args()
+
+    paths, volume_paths = collect_paths(args.inputs)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    done = already_scored(args.output)
+    todo = [p for p in paths if p not in done]
+    volumes = []
+    for volume_path in volume_paths:
+        volume = open_volume(volume_path)
+        slices = [z for z in range(len(volume)) if f"{volume_path}#{z}" not in done]
+        if slices:
+            volumes.append((volume_path, volume, slices))
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already scored, {len(todo)} to score; "
+          f"{len(volumes)} of {len(volume_paths)} volumes to score", file=sys.stderr)
+    if not todo and not volumes:
+        return
+
+    from utils.model_cache import get_model, model_stats
+    model = get_model(args.model)
+    print(f"Model loaded in {model_stats(args.model)['load_seconds']:.2f}s", file=sys.stderr)
+
+    writer = ResultWriter(args.output)
+    try:
+        start = time.perf_counter()
+        scored, _ = score(model, todo, writer, args.batch_size, args.workers, args.threshold, args.tta_views)
+        for volume_path, volume, slices in volumes:
+            inferred = score_volume(model, volume, volume_path, slices, writer, args.batch_size,
+                                    args.threshold, args.tta_views, args.early_exit)
+            scored += inferred
+            print(f"{volume_path}: {inferred} of {len(slices)} slices inferred", file=sys.stderr)
+        elapsed = time.perf_counter() - start
+    finally:
+        writer.close()
+    print(f"Scored {scored} images in {elapsed:.2f}s ({scored / elapsed:.1f} images/sec)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.preprocessing import preprocess_batch
+
+# Per-image latency and allocation cost of the serving preprocessing path: the old
+# PIL + float64 code from app.py against the shared uint8 -> float32 batch path.
+
+def legacy_preprocess(image_path):
+    image = Image.open(image_path).resize((224, 224))
+    image = np.array(image)
+
+    if image.ndim == 2:
+        image = np.stack([image] * 3, axis=-1)
+    elif image.shape[2] == 4:
+        image = image[:, :, :3]
+
+    image = image / 255.0
+    return np.expand_dims(image, axis=0)
+
+def measure(fn, paths, repeats):
+    fn(paths[:1])  # warm up pools and codecs
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(paths)
+        timings.append((time.perf_counter() - start) / len(paths))
+
+    # Traced peak while preprocessing one image covers the output and every intermediate
+    # array; whatever exceeds the output size is temporary allocation
+    tracemalloc.start()
+    output = fn(paths[:1])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "ms_per_image_median": float(np.median(timings) * 1000),
+        "ms_per_image_p95": float(np.percentile(timings, 95) * 1000),
+        "peak_bytes_per_image": int(peak),
+        "output_bytes_per_image": int(output.nbytes),
+        "temporary_bytes_per_image": int(peak - output.nbytes),
+        "output_dtype": str(output.dtype),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serving-side image preprocessing")
+    parser.add_argument("--data-dir", default="data/test", help="directory searched recursively for images")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.data_dir, "**", "*.jpg"), recursive=True))[:args.limit]
+    if not paths:
+        parser.error(f"no .jpg images under {args.data_dir}")
+
+    results = {
+        "images": len(paths),
+        "legacy_pil_float64": measure(lambda batch: np.concatenate([legacy_preprocess(p) for p in batch]),
+                                      paths, args.repeats),
+        "shared_uint8_float32": measure(preprocess_batch, paths, args.repeats),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
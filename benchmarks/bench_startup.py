@@ -0,0 +1,89 @@
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from benchmarks.run_benchmarks import make_synthetic_model, run_isolated
+
+# Cold-start report for the Streamlit apps: time to first render of the welcome page in a
+# fresh process, with the model loaded before rendering ("eager", the old startup) and
+# deferred until after login ("background"), plus the per-rerun cost of the background CSS.
+#
+#   python benchmarks/bench_startup.py --output startup.json
+#   python benchmarks/bench_startup.py --model models/final_model.h5
+
+def first_render(script, model_path, preload_mode, reruns):
+    # Runs in a fresh process: the first AppTest run pays every import and load, like the
+    # first visitor after the server starts
+    os.environ["PCD_MODEL_PATH"] = model_path
+    os.environ["PCD_PRELOAD_MODEL"] = preload_mode
+    os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+    from streamlit.testing.v1 import AppTest
+
+    start = time.perf_counter()
+    app = AppTest.from_file(script, default_timeout=600).run()
+    first = time.perf_counter() - start
+    if app.exception:
+        return {"error": str(app.exception[0].message)}
+
+    timings = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - start)
+    return {"first_render_seconds": first, "rerun_ms_p50": float(np.median(timings) * 1000),
+            "tensorflow_imported": "tensorflow" in sys.modules}
+
+def background_css_cost(image_file, repeats=50):
+    from utils.startup import background_css
+
+    def legacy():  # what set_background did on every script run
+        with open(image_file, "rb") as f:
+            return base64.b64encode(f.read()).decode()
+
+    results = {"image_kb": os.path.getsize(image_file) / 1024}
+    for name, fn in (("per_run_encode", legacy), ("cached", lambda: background_css(image_file))):
+        fn()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        results[f"{name}_ms"] = (time.perf_counter() - start) / repeats * 1000
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit cold-start benchmark")
+    parser.add_argument("--model", help="model to load (default: a synthetic Keras model)")
+    parser.add_argument("--apps", nargs="+", default=["app.py", "final_medical.py"])
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model or make_synthetic_model(os.path.join(tmp, "model.h5"))
+        report = {"model": args.model or "synthetic", "apps": {}}
+        for app in args.apps:
+            script = os.path.join(project_root, app)
+            report["apps"][app] = {mode: run_isolated(first_render, script, model_path, mode, args.reruns)
+                                   for mode in ("eager", "background")}
+            eager, lazy = report["apps"][app]["eager"], report["apps"][app]["background"]
+            if "error" not in eager and "error" not in lazy:
+                report["apps"][app]["first_render_speedup"] = \
+                    eager["first_render_seconds"] / lazy["first_render_seconds"]
+    report["background_css"] = background_css_cost(os.path.join(project_root, "background.jpg"))
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
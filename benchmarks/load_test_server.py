@@ -0,0 +1,49 @@
+import argparse
+import glob
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Fires concurrent /predict requests at a running serve.py and reports client-side
+# throughput next to the server's own batching metrics. Works on CPU-only machines.
+
+def post_image(url, data):
+    request = urllib.request.Request(url + "/predict", data=data, method="POST",
+                                     headers={"Content-Type": "application/octet-stream"})
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP prediction service")
+    parser.add_argument("--url", default="http://127.0.0.1:8500")
+    parser.add_argument("--data-dir", default="data/test")
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.data_dir, "**", "*.jpg"), recursive=True))
+    if not paths:
+        parser.error(f"no .jpg images under {args.data_dir}")
+    payloads = []
+    for i in range(args.requests):
+        with open(paths[i % len(paths)], "rb") as f:
+            payloads.append(f.read())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda data: post_image(args.url, data), payloads))
+    elapsed = time.perf_counter() - start
+
+    with urllib.request.urlopen(args.url + "/metrics") as response:
+        metrics = json.load(response)
+    print(json.dumps({
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "requests_per_sec": len(results) / elapsed,
+        "server": metrics,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.instrumentation import peak_rss_mb, wait_for_child
+
+# Offline performance suite for the data-loading and serving paths. Uses synthetic JPEGs
+# and a tiny synthetic Keras model by default, so it runs anywhere without the dataset or
+# final_model.h5, and prints machine-readable JSON for tracking regressions across versions.
+#
+#   python benchmarks/run_benchmarks.py --output bench.json
+#   python benchmarks/run_benchmarks.py --data-dir data/test --model models/final_model.h5
+
+def make_synthetic_images(root, per_class=64, size=(512, 512), seed=0):
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    for class_name in ("normal", "pancreatic_cancer"):
+        class_dir = os.path.join(root, class_name)
+        os.makedirs(class_dir, exist_ok=True)
+        for i in range(per_class):
+            image = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(class_dir, f"{i:04d}.jpg"), image)
+    return root
+
+def make_synthetic_model(path, input_shape=(224, 224, 3)):
+    import tensorflow as tf
+
+    inputs = tf.keras.layers.Input(shape=input_shape)
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation="relu")(inputs)
+    x = tf.keras.layers.Conv2D(32, 3, strides=2, activation="relu")(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dense(64, activation="relu")(x)
+    outputs = tf.keras.layers.Dense(1, activation="sigmoid")(x)
+    tf.keras.Model(inputs, outputs).save(path)
+    return path
+
+def _child(fn, args, result_queue):
+    # Results travel over the queue only; anything the measured code prints (e.g. load_data's
+    # label mapping) goes to stderr so the JSON report on stdout stays parseable
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            result = {"error": repr(e)}
+    result_queue.put(result)
+
+def run_isolated(fn, *args, timeout=None):
+    # Fresh process per measurement: clean peak RSS and TF thread settings that apply from startup.
+    # A child that crashes, is OOM-killed or overruns timeout seconds yields {"error": ...}.
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    process = context.Process(target=_child, args=(fn, args, result_queue))
+    process.start()
+    return wait_for_child(process, result_queue, timeout)
+
+def bench_load_data(data_dir, cache_dir):
+    from utils.data_loader import load_cached_data, load_data, stream_data
+
+    results = {}
+    start = time.perf_counter()
+    images, _ = load_data(data_dir)
+    elapsed = time.perf_counter() - start
+    results["load_data"] = {"images": len(images), "images_per_sec": len(images) / elapsed,
+                            "peak_rss_mb": peak_rss_mb()}
+    del images
+
+    start = time.perf_counter()
+    count = sum(len(batch) for batch, _ in stream_data(data_dir, batch_size=32))
+    results["stream_data"] = {"images": count, "images_per_sec": count / (time.perf_counter() - start)}
+
+    for label in ("cache_cold", "cache_warm"):
+        start = time.perf_counter()
+        images, _ = load_cached_data(data_dir, cache_dir)
+        results[label] = {"images": len(images), "seconds": time.perf_counter() - start}
+    return results
+
+def bench_split(num_images, img_size=(224, 224)):
+    from utils.data_loader import split_data, split_indices
+
+    images = np.zeros((num_images, img_size[1], img_size[0], 3), dtype=np.float32)
+    labels = np.arange(num_images, dtype=np.int32) % 2
+    results = {"dataset_mb": images.nbytes / 2**20}
+    for name, fn in (("split_data", lambda: split_data(images, labels)),
+                     ("split_indices", lambda: split_indices(labels))):
+        tracemalloc.start()
+        start = time.perf_counter()
+        output = fn()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del output
+        results[name] = {"seconds": elapsed, "overhead_mb": peak / 2**20,
+                         "overhead_ratio": peak / images.nbytes}
+    return results
+
+def bench_serving(model_path, data_dir, batch_sizes, threads, repeats):
+    import tensorflow as tf
+
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    from utils.backends import load_inference_model
+    from utils.data_loader import list_images
+    from utils.preprocessing import preprocess_batch
+
+    start = time.perf_counter()
+    model = load_inference_model(model_path)
+    results = {"threads": threads, "model_load_seconds": time.perf_counter() - start}
+
+    paths, _, _ = list_images(data_dir)
+    single = paths[0]
+    preprocess_batch([single])
+    model.predict(preprocess_batch([single]), batch_size=1, verbose=0)  # warm-up / tracing
+    latencies = []
+    for _ in range(repeats * 5):
+        start = time.perf_counter()
+        model.predict(preprocess_batch([single]), batch_size=1, verbose=0)
+        latencies.append(time.perf_counter() - start)
+    results["single_image_ms"] = {"p50": float(np.percentile(latencies, 50) * 1000),
+                                  "p95": float(np.percentile(latencies, 95) * 1000)}
+
+    results["batched"] = {}
+    for batch_size in batch_sizes:
+        batch_paths = (paths * (batch_size // len(paths) + 1))[:batch_size]
+        model.predict(preprocess_batch(batch_paths), batch_size=batch_size, verbose=0)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.predict(preprocess_batch(batch_paths), batch_size=batch_size, verbose=0)
+        elapsed = (time.perf_counter() - start) / repeats
+        results["batched"][str(batch_size)] = {"images_per_sec": batch_size / elapsed,
+                                               "ms_per_batch": elapsed * 1000}
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def environment():
+    import cv2
+    import tensorflow as tf
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "tensorflow": tf.__version__,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the data-loading and inference benchmarks")
+    parser.add_argument("--data-dir", help="class-folder dataset (default: synthetic images)")
+    parser.add_argument("--model", help="model to serve (default: synthetic tiny model)")
+    parser.add_argument("--synthetic-per-class", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--split-images", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds allowed per measurement process")
+    parser.add_argument("--output", help="write JSON here as well as to stdout")
+    args = parser.parse_args()
+    timeout = args.timeout
+
+    work_dir = tempfile.mkdtemp(prefix="pcd_bench_")
+    try:
+        data_dir = args.data_dir or make_synthetic_images(os.path.join(work_dir, "data"), args.synthetic_per_class)
+        model_path = args.model or run_isolated(make_synthetic_model, os.path.join(work_dir, "model.h5"),
+                                                timeout=timeout)
+        if isinstance(model_path, dict):
+            raise RuntimeError(f"Building the synthetic model failed: {model_path['error']}")
+
+        report = {"environment": run_isolated(environment, timeout=timeout),
+                  "config": {"data_dir": args.data_dir or "synthetic", "model": args.model or "synthetic",
+                             "batch_sizes": args.batch_sizes, "threads": args.threads},
+                  "data_loading": run_isolated(bench_load_data, data_dir, os.path.join(work_dir, "cache"),
+                                               timeout=timeout),
+                  "split": run_isolated(bench_split, args.split_images, timeout=timeout),
+                  "serving": [run_isolated(bench_serving, model_path, data_dir, args.batch_sizes, threads,
+                                           args.repeats, timeout=timeout)
+                              for threads in args.threads]}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
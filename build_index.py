@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.data_loader import list_images
+from utils.embedding_index import build_index
+
+# Builds the similar-case index shown on the result page from a class-folder dataset:
+#   python build_index.py data/train
+#   python build_index.py data/train --approximate   # adds an IVF index for large corpora
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the similar-case embedding index")
+    parser.add_argument("data_dir", help="directory with one sub-folder per class")
+    parser.add_argument("--model", default=os.path.join(project_root, "models/final_model.h5"))
+    parser.add_argument("--output", default=os.path.join(project_root, "models/embedding_index.npz"))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="decode threads (default: CPU based)")
+    parser.add_argument("--approximate", action="store_true", help="also build an IVF index (approximate search)")
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default: sqrt of the corpus size)")
+    args = parser.parse_args()
+
+    from utils.model_cache import get_model, model_version
+    paths, labels, label_map = list_images(args.data_dir)
+    model = get_model(args.model)
+
+    start = time.perf_counter()
+    index = build_index(model, paths, labels, model_version(args.model), args.batch_size, args.workers)
+    if index is None:
+        sys.exit(f"No readable images under {args.data_dir}")
+    if args.approximate:
+        index.build_ivf(args.lists)
+    index.save(args.output)
+
+    print(json.dumps({"label_map": label_map, "rows": index.size, "dim": index.dim,
+                      "ivf_lists": 0 if index.centroids is None else len(index.centroids),
+                      "seconds": round(time.perf_counter() - start, 2), "output": args.output}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import json
+import os
+import sys
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.data_loader import list_images
+from utils.evaluation import evaluate
+
+# Streaming evaluation of a class-folder dataset (e.g. data/test). The dataset is scored once
+# (predictions are cached per file, so a rerun doesn't run the model) and every threshold is
+# read from the same accumulated metrics:
+#   python evaluate.py data/test --thresholds 0.3 0.5 0.7
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the trained model on a class-folder dataset")
+    parser.add_argument("data_dir", help="directory with one sub-folder per class")
+    parser.add_argument("--model", default=os.path.join(project_root, "models/final_model.h5"))
+    parser.add_argument("--cache", default=os.path.join(project_root, "models/eval_predictions.csv"),
+                        help="per-file prediction cache (CSV)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", help="write the metrics JSON here as well as to stdout")
+    args = parser.parse_args()
+
+    from utils.model_cache import get_model, model_version
+    paths, labels, label_map = list_images(args.data_dir)
+    model = get_model(args.model)
+    version = model_version(args.model)
+
+    # One pass; the first threshold's confusion matrix is exact, the others come from the
+    # probability histogram (1/1000 resolution)
+    metrics, _ = evaluate(model, paths, labels, args.cache, version, args.thresholds[0], args.batch_size)
+    results = {"label_map": label_map, "model_version": version,
+               "metrics": [metrics.result(threshold) for threshold in args.thresholds]}
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
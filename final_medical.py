@@ -1,10 +1,7 @@
 import os
 import sys
-import time
-import base64
 import numpy as np
 import streamlit as st
-from tensorflow.keras.models import load_model
 from PIL import Image
 
 # =========================
@@ -19,32 +16,31 @@ if project_root not in sys.path:
 # =========================
 # ✅ Load Trained Model
 # =========================
-model_path = os.path.join(project_root, "models/final_model.h5")
-
-try:
-    model = load_model(model_path, compile=False)
-except Exception as e:
-    st.error(f"Error loading model: {e}")
-    st.stop()
+from utils.model_cache import get_model, preload
+from utils.upload_store import get_configured_upload_store
+from utils.startup import background_css, mark_first_render
+
+model_path = os.environ.get("PCD_MODEL_PATH", os.path.join(project_root, "models/final_model.h5"))
+# "background" (default): load after login; "eager": before the first render; "off": not at all
+# (the result page below doesn't run the model yet)
+preload_mode = os.environ.get("PCD_PRELOAD_MODEL", "background")
+
+def load_model():
+    # Loaded and warmed up once per process, shared across sessions; welcome/login never wait for it
+    try:
+        return get_model(model_path)
+    except Exception as e:
+        st.error(f"Error loading model: {e}")
+        st.stop()
+
+if preload_mode == "eager":
+    load_model()
 
 # =========================
 # 🎨 Set Background Image
 # =========================
 def set_background(image_file):
-    with open(image_file, "rb") as f:
-        encoded_string = base64.b64encode(f.read()).decode()
-
-    bg_image = f"""
-    <style>
-    .stApp {{
-        background-image: url("data:image/jpg;base64,{encoded_string}");
-        background-size: cover;
-        background-position: center;
-        background-repeat: no-repeat;
-    }}
-    </style>
-    """
-    st.markdown(bg_image, unsafe_allow_html=True)
+    st.markdown(background_css(image_file), unsafe_allow_html=True)  # encoded once per process
 
 background_image_path = os.path.join(project_root, "background.jpg")
 set_background(background_image_path)
@@ -68,20 +64,18 @@ if "patient_details" not in st.session_state:
     st.session_state["patient_details"] = {}
 
 # =========================
-# 🏠 Welcome Page (3 sec)
+# 🏠 Welcome Page
 # =========================
+# Shown once, above the login form in the same run; no wait and no extra click
 if st.session_state["page"] == "welcome":
     st.title("👋 Welcome to Medical Diagnosis App")
     st.write("This application helps in detecting Pancreatic Cancer, Tumors, and other diseases using AI.")
-    
-    time.sleep(3)
     st.session_state["page"] = "login"
-    st.rerun()
 
 # =========================
 # 🔐 Login Page
 # =========================
-elif st.session_state["page"] == "login":
+if st.session_state["page"] == "login":
     st.title("🔐 User Login")
 
     username = st.text_input("Enter Username")
@@ -90,10 +84,11 @@ elif st.session_state["page"] == "login":
     if st.button("Login"):
         if username == "admin" and password == "1234":
             st.session_state["authenticated"] = True
+            if preload_mode == "background":
+                preload(model_path)
             st.success("Login Successful ✅")
 
             # Move to the patient details form and refresh page
-            time.sleep(1)  # Add a small delay for smooth transition
             st.session_state["page"] = "patient_details"
             st.rerun()
         else:
@@ -134,7 +129,6 @@ elif st.session_state["page"] == "patient_details":
         st.success("Details Saved! ✅")
 
         # Move to the disease selection page
-        time.sleep(1)  # Small delay for smooth transition
         st.session_state["page"] = "upload_image"
         st.rerun()
 
@@ -160,17 +154,16 @@ elif st.session_state["page"] == "upload_image":
     uploaded_file = st.file_uploader("Upload a CT Scan Image", type=["jpg", "png", "jpeg"])
 
     if uploaded_file:
-        uploads_dir = os.path.join(project_root, "uploads")
-        os.makedirs(uploads_dir, exist_ok=True)
-        image_path = os.path.join(uploads_dir, uploaded_file.name)
-        
-        with open(image_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        st.session_state["uploaded_image"] = image_path
+        # Same content-addressed store and limits as app.py; written in the background
+        upload_store = get_configured_upload_store(os.path.join(project_root, "uploads", "store"))
+        # Pinned as it is stored, so it can't be evicted while processed and shown
+        upload_store.unpin(st.session_state.get("upload_pin"))
+        pin = st.session_state["upload_pin"] = upload_store.pin()
+        blob = upload_store.put(uploaded_file.getbuffer(), os.path.splitext(uploaded_file.name.lower())[1], pin=pin)
+
+        st.session_state["uploaded_image"] = blob.path
         st.success("Image uploaded successfully!")
 
-        time.sleep(2)
         st.session_state["page"] = "processing"
         st.rerun()
 
@@ -181,7 +174,6 @@ elif st.session_state["page"] == "processing":
     st.title("🔄 Processing Image...")
     st.write("Analyzing the image...")
 
-    time.sleep(3)
     st.session_state["page"] = "result"
     st.rerun()
 
@@ -307,3 +299,5 @@ Staying active improves physical and mental well-being:
     if st.button("🔙 Back to Result"):
         st.session_state["page"] = "result"
         st.rerun()
+
+mark_first_render("final_medical.py", st.session_state["page"])
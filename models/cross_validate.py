@@ -0,0 +1,202 @@
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.data_loader import batch_sequence, kfold_indices, load_cached_data, normalize_batch
+
+# Stratified (repeated) k-fold training. Folds train concurrently in a process pool;
+# the preprocessed uint8 image tensor is placed in shared memory once and every worker
+# maps it read-only, so nothing is pickled per fold. Each worker's TensorFlow/OpenMP
+# thread pools are capped so workers x threads never exceeds the cores.
+#
+#   python models/cross_validate.py data/train --folds 5 --repeats 2 --workers 2
+
+METRICS = ("accuracy", "sensitivity", "specificity", "precision", "roc_auc", "log_loss")
+
+# Per-worker state, set up once by _init_worker
+_worker = {}
+
+def _init_worker(threads, shm_name, shape, dtype, labels):
+    # Thread caps have to be in place before TensorFlow is imported in this process
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[var] = str(threads)
+    import cv2
+    import tensorflow as tf
+
+    cv2.setNumThreads(threads)
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    shm = _attach_untracked(shm_name)
+    images = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    images.flags.writeable = False
+    _worker.update(shm=shm, images=images, labels=labels)
+
+def _attach_untracked(name):
+    # SharedMemory(name=...) registers the segment with the resource tracker as if this
+    # process owned it, which produces leak warnings and can unlink it early. The parent
+    # created the segment and unlinks it once every fold is done, so workers attach
+    # without registering (Python 3.13+ has track=False for this).
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == "shared_memory" else register(name, rtype)
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _load_builder(spec):
+    # "package.module:function" -> callable(input_shape) returning a compiled model
+    module_name, func_name = spec.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+def _train_fold(split, builder_spec, checkpoint_dir, epochs, batch_size, patience, seed):
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+    from utils.evaluation import StreamingMetrics
+
+    images, labels = _worker["images"], _worker["labels"]
+    name = f"repeat{split['repeat']}_fold{split['fold']}"
+    checkpoint = os.path.join(checkpoint_dir, f"{name}.h5")
+
+    start = time.perf_counter()
+    model = _load_builder(builder_spec)(images.shape[1:])
+    history = model.fit(
+        # Batches are normalized straight from shared memory; a fold never holds a float32 copy
+        batch_sequence(images, labels, split["train"], batch_size, True, seed),
+        validation_data=batch_sequence(images, labels, split["val"], batch_size, False, seed),
+        epochs=epochs,
+        # One monitor for both, so the checkpoint and the restored weights are the same epoch
+        callbacks=[ModelCheckpoint(checkpoint, monitor="val_loss", save_best_only=True),
+                   EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True)],
+        verbose=0,
+    )
+    train_seconds = time.perf_counter() - start
+    best_epoch = int(np.argmin(history.history["val_loss"]))
+
+    metrics = StreamingMetrics()
+    probabilities = []
+    for batch_start in range(0, len(split["test"]), batch_size):
+        batch_idx = split["test"][batch_start:batch_start + batch_size]
+        p = model.predict_on_batch(normalize_batch(images[batch_idx])).reshape(-1)
+        metrics.update(p, labels[batch_idx])
+        probabilities.append(p)
+
+    return {
+        "repeat": split["repeat"], "fold": split["fold"], "pid": os.getpid(),
+        "train_size": len(split["train"]), "val_size": len(split["val"]), "test_size": len(split["test"]),
+        "epochs": len(history.history["loss"]),
+        "best_epoch": best_epoch + 1,
+        "best_val_loss": float(history.history["val_loss"][best_epoch]),
+        "best_val_accuracy": float(history.history.get("val_accuracy", [float("nan")] * (best_epoch + 1))[best_epoch]),
+        "train_seconds": round(train_seconds, 2),
+        "checkpoint": checkpoint,
+        "metrics": metrics.result(),
+        "test_idx": split["test"],
+        "probabilities": np.concatenate(probabilities) if probabilities else np.empty((0,), np.float32),
+    }
+
+def aggregate(fold_results):
+    # Mean / std / min / max of every scalar test metric across folds
+    summary = {}
+    for name in METRICS:
+        values = np.array([r["metrics"][name] for r in fold_results], dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            summary[name] = {"mean": float(values.mean()),
+                             "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+                             "min": float(values.min()), "max": float(values.max())}
+    return summary
+
+def cross_validate(images, labels, output_dir, folds=5, repeats=1, workers=2, threads_per_worker=None,
+                   builder_spec="models.custom_model:build_model", epochs=20, batch_size=32, patience=5,
+                   val_size=0.1, seed=42):
+    # images: (N, H, W, 3) uint8, e.g. the memmap returned by load_cached_data
+    os.makedirs(output_dir, exist_ok=True)
+    splits = kfold_indices(labels, folds, repeats, val_size, seed)
+    workers = max(1, min(workers, len(splits)))
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(images.nbytes, 1))
+    try:
+        shared = np.ndarray(images.shape, dtype=images.dtype, buffer=shm.buf)
+        shared[:] = images  # the only copy of the data made for training
+        del shared
+
+        start = time.perf_counter()
+        results = []
+        context = multiprocessing.get_context("spawn")  # fresh TF runtime per worker
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(threads_per_worker, shm.name, images.shape, images.dtype,
+                                           np.asarray(labels))) as pool:
+            futures = [pool.submit(_train_fold, split, builder_spec, output_dir, epochs, batch_size, patience,
+                                   seed) for split in splits]
+            for future in as_completed(futures):
+                result = future.result()
+                print(f"repeat {result['repeat']} fold {result['fold']}: "
+                      f"accuracy {result['metrics']['accuracy']:.4f}, {result['epochs']} epochs, "
+                      f"{result['train_seconds']:.1f}s", file=sys.stderr)
+                results.append(result)
+        elapsed = time.perf_counter() - start
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results.sort(key=lambda r: (r["repeat"], r["fold"]))
+    # Out-of-fold probabilities, one row per repeat, for threshold tuning / calibration later
+    oof = np.full((repeats, len(labels)), np.nan, dtype=np.float32)
+    for r in results:
+        oof[r["repeat"], r.pop("test_idx")] = r.pop("probabilities")
+    np.save(os.path.join(output_dir, "oof_probabilities.npy"), oof)
+
+    report = {
+        "folds": folds, "repeats": repeats, "workers": workers, "threads_per_worker": threads_per_worker,
+        "builder": builder_spec, "epochs": epochs, "batch_size": batch_size, "seed": seed,
+        "num_samples": int(len(labels)), "wall_seconds": round(elapsed, 2),
+        "summary": aggregate(results), "per_fold": results,
+    }
+    with open(os.path.join(output_dir, "cv_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel stratified k-fold training")
+    parser.add_argument("data_dir", help="directory with one sub-folder per class, e.g. data/train")
+    parser.add_argument("--cache-dir", default=None, help="uint8 image cache (default: data/cache/<data_dir name>)")
+    parser.add_argument("--output-dir", default=os.path.join(project_root, "models/cv"))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=2, help="folds trained concurrently")
+    parser.add_argument("--threads-per-worker", type=int, default=None, help="default: cores / workers")
+    parser.add_argument("--builder", default="models.custom_model:build_model",
+                        help="module:function building a compiled model from an input shape")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or os.path.join(project_root, "data/cache",
+                                               os.path.basename(os.path.normpath(args.data_dir)))
+    images, labels = load_cached_data(args.data_dir, cache_dir)
+    report = cross_validate(images, labels, args.output_dir, args.folds, args.repeats, args.workers,
+                            args.threads_per_worker, args.builder, args.epochs, args.batch_size, args.patience,
+                            seed=args.seed)
+    print(json.dumps({key: report[key] for key in ("folds", "repeats", "wall_seconds", "summary")}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
+import os
+import json
+import numpy as np
 from tensorflow.keras.applications import ResNet50
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, Input
 from tensorflow.keras.optimizers import Adam
+from utils.data_loader import array_digest
+from utils.preprocessing import normalize_batch
+
+FEATURE_DIM = 2048  # ResNet50 + GlobalAveragePooling2D output width
 
 def build_model(input_shape=(224, 224, 3)):
     base_model = ResNet50(weights='imagenet', include_top=False, input_shape=input_shape)
@@ -20,3 +27,89 @@ def build_model(input_shape=(224, 224, 3)):
                   loss='binary_crossentropy',
                   metrics=['accuracy'])
     return model
+
+# =========================
+# Frozen-backbone feature cache
+# =========================
+# The backbone is frozen in build_model, so its pooled activations never change
+# during training. Computing them once and training only the head on the cached
+# embeddings gives the same model at a fraction of the per-epoch cost.
+
+def build_backbone(input_shape=(224, 224, 3)):
+    base_model = ResNet50(weights='imagenet', include_top=False, input_shape=input_shape)
+    features = GlobalAveragePooling2D()(base_model.output)
+    backbone = Model(inputs=base_model.input, outputs=features)
+    backbone.trainable = False
+    return backbone
+
+def build_head(feature_dim=FEATURE_DIM):
+    # Same layers as the top of build_model, so trained weights can be copied across
+    inputs = Input(shape=(feature_dim,))
+    x = Dense(512, activation='relu')(inputs)
+    x = Dropout(0.3)(x)
+    predictions = Dense(1, activation='sigmoid')(x)
+
+    head = Model(inputs=inputs, outputs=predictions)
+    head.compile(optimizer=Adam(learning_rate=0.0001),
+                 loss='binary_crossentropy',
+                 metrics=['accuracy'])
+    return head
+
+def _read_features_key(key_path):
+    if not os.path.exists(key_path):
+        return None
+    with open(key_path) as f:
+        return json.load(f).get("images_sha1")
+
+def extract_features(images, features_path, batch_size=32, input_shape=(224, 224, 3), overwrite=False):
+    # Runs the frozen backbone once over `images` (uint8 memmap or normalized float array)
+    # and stores the embeddings as a float16 .npy; returns them memory-mapped. A sidecar
+    # .json records the content hash of the images, so the cache is only reused for the
+    # exact same dataset (not merely the same image count).
+    key_path = os.path.splitext(features_path)[0] + ".json"
+    images_sha1 = array_digest(images)
+    if not overwrite and os.path.exists(features_path) and _read_features_key(key_path) == images_sha1:
+        features = np.load(features_path, mmap_mode='r')
+        if features.shape == (len(images), FEATURE_DIM):
+            return features
+
+    # The key goes first and the features are written under a temp name, so a crash
+    # mid-write never leaves a partial file that a stale key vouches for
+    if os.path.exists(key_path):
+        os.remove(key_path)
+    backbone = build_backbone(input_shape)
+    tmp_path = features_path + ".tmp.npy"
+    store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16,
+                                      shape=(len(images), FEATURE_DIM))
+    for start in range(0, len(images), batch_size):
+        batch = np.asarray(images[start:start + batch_size])
+        if batch.dtype == np.uint8:
+            batch = normalize_batch(batch)  # same normalization as load_data
+        store[start:start + len(batch)] = backbone.predict_on_batch(batch)
+    store.flush()
+    del store
+    os.replace(tmp_path, features_path)
+    with open(key_path + ".tmp", "w") as f:
+        json.dump({"images_sha1": images_sha1, "rows": len(images)}, f)
+    os.replace(key_path + ".tmp", key_path)
+
+    return np.load(features_path, mmap_mode='r')
+
+def train_head(features, labels, train_idx, val_idx, epochs=20, batch_size=32, callbacks=None):
+    head = build_head(features.shape[1])
+    history = head.fit(
+        np.asarray(features[train_idx], dtype=np.float32), labels[train_idx],
+        validation_data=(np.asarray(features[val_idx], dtype=np.float32), labels[val_idx]),
+        epochs=epochs,
+        batch_size=batch_size,
+        callbacks=callbacks
+    )
+    return head, history
+
+def assemble_model(head, input_shape=(224, 224, 3)):
+    # Stitch a head trained on cached features back onto the ResNet50 backbone,
+    # giving a full model that can be saved as final_model.h5 and served as before
+    model = build_model(input_shape)
+    for model_layer, head_layer in zip(model.layers[-3:], head.layers[-3:]):
+        model_layer.set_weights(head_layer.get_weights())
+    return model
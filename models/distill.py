@@ -0,0 +1,156 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from sklearn.model_selection import train_test_split
+from utils.data_loader import array_digest, batch_sequence, load_cached_data, normalize_batch
+
+# Knowledge distillation of final_model.h5 (ResNet50, ~25M parameters) into a small student
+# for CPU serving. The teacher runs once over data/train and its logits are cached; the
+# student then trains on a mix of the hard labels and the teacher's temperature-softened
+# probabilities. The saved student takes the same /255 BGR input and outputs the same
+# sigmoid probability, so it is a drop-in PCD_MODEL_PATH for app.py, batch_score.py and
+# serve.py. The report reuses models/quantize.py's per-model measurements.
+#
+#   python models/distill.py --teacher models/final_model.h5 --student mobilenet
+#   python models/distill.py --student small_cnn --temperature 4 --alpha 0.3
+
+STUDENTS = ("mobilenet", "small_cnn")
+
+def build_student(input_shape=(224, 224, 3), kind="mobilenet", weights="imagenet"):
+    # The "logits" layer is what distillation trains against; "probability" is what serving sees
+    from tensorflow.keras.applications import MobileNetV2
+    from tensorflow.keras.layers import (Activation, BatchNormalization, Conv2D, Dense, Dropout,
+                                         GlobalAveragePooling2D, Input, Rescaling)
+    from tensorflow.keras.models import Model
+
+    inputs = Input(shape=input_shape)
+    if kind == "mobilenet":
+        # MobileNetV2 at width 0.35 (~0.4M backbone parameters); expects [-1, 1] input. Built on
+        # input_tensor so its layers are flat like the teacher's and Grad-CAM can reach out_relu.
+        base = MobileNetV2(input_tensor=Rescaling(2.0, offset=-1.0)(inputs), alpha=0.35, include_top=False,
+                           weights=weights)
+        x = base.output
+    elif kind == "small_cnn":
+        # Five stride-2 blocks: a 7x7 final feature map for 224x224 input, like the teacher's
+        x = inputs
+        for filters in (16, 32, 64, 128, 256):
+            x = Conv2D(filters, 3, strides=2, padding="same", use_bias=False)(x)
+            x = BatchNormalization()(x)
+            x = Activation("relu")(x)
+    else:
+        raise ValueError(f"Unknown student {kind!r}, expected one of {STUDENTS}")
+
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(0.2)(x)
+    logits = Dense(1, name="logits")(x)
+    probability = Activation("sigmoid", name="probability")(logits)
+    return Model(inputs=inputs, outputs=probability)
+
+def distillation_loss(temperature=4.0, alpha=0.5):
+    # y_true columns: (hard label, teacher logit). alpha weights the hard-label loss; the soft
+    # term is scaled by T^2 so its gradients keep their magnitude as the temperature changes.
+    import tensorflow as tf
+
+    def loss(y_true, logits):
+        hard, teacher_logits = y_true[:, :1], y_true[:, 1:2]
+        hard_loss = tf.keras.losses.binary_crossentropy(hard, logits, from_logits=True)
+        soft_targets = tf.sigmoid(teacher_logits / temperature)
+        soft_loss = tf.keras.losses.binary_crossentropy(soft_targets, logits / temperature, from_logits=True)
+        return alpha * hard_loss + (1 - alpha) * temperature ** 2 * soft_loss
+
+    return loss
+
+def hard_accuracy(y_true, logits):
+    import tensorflow as tf
+    return tf.reduce_mean(tf.cast(tf.equal(y_true[:, :1] > 0.5, logits > 0), tf.float32))
+
+def teacher_logits(teacher_path, images, cache_dir, batch_size=32):
+    # Teacher logits for every cached image, computed once per teacher version and image content
+    from utils.model_cache import get_model, model_version
+
+    key = hashlib.sha1(f"{model_version(teacher_path)}:{array_digest(images)}".encode()).hexdigest()[:12]
+    logits_path = os.path.join(cache_dir, f"teacher_logits_{key}.npy")
+    if os.path.exists(logits_path):
+        return np.load(logits_path)
+
+    teacher = get_model(teacher_path)
+    probabilities = np.concatenate([
+        np.asarray(teacher.predict_on_batch(normalize_batch(images[start:start + batch_size]))).reshape(-1)
+        for start in range(0, len(images), batch_size)
+    ]).astype(np.float64)
+    probabilities = np.clip(probabilities, 1e-7, 1 - 1e-7)
+    logits = np.log(probabilities / (1 - probabilities)).astype(np.float32)
+    np.save(logits_path, logits)
+    return logits
+
+def distill(teacher_path, train_dir, output_path, cache_dir, student="mobilenet", weights="imagenet",
+            temperature=4.0, alpha=0.5, epochs=20, batch_size=32, patience=5, val_size=0.1, seed=42):
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.optimizers import Adam
+
+    images, labels = load_cached_data(train_dir, cache_dir)  # uint8 memmap
+    targets = np.stack([labels.astype(np.float32), teacher_logits(teacher_path, images, cache_dir, batch_size)],
+                       axis=1)
+    train_idx, val_idx = train_test_split(np.arange(len(labels)), test_size=val_size, random_state=seed,
+                                          stratify=labels)
+
+    model = build_student(images.shape[1:], student, weights)
+    trainer = Model(inputs=model.inputs, outputs=model.get_layer("logits").output)  # shares the weights
+    trainer.compile(optimizer=Adam(learning_rate=0.001), loss=distillation_loss(temperature, alpha),
+                    metrics=[hard_accuracy])
+    history = trainer.fit(
+        batch_sequence(images, targets, np.sort(train_idx), batch_size, shuffle=True, seed=seed),
+        validation_data=batch_sequence(images, targets, np.sort(val_idx), batch_size),
+        epochs=epochs,
+        callbacks=[EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True)],
+    )
+    model.save(output_path)
+    return model, history
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill final_model.h5 into a compact student model")
+    parser.add_argument("--teacher", default=os.path.join(project_root, "models/final_model.h5"))
+    parser.add_argument("--train-dir", default=os.path.join(project_root, "data/train"))
+    parser.add_argument("--test-dir", default=os.path.join(project_root, "data/test"))
+    parser.add_argument("--cache-dir", default=None, help="uint8 image cache (default: data/cache/<train_dir name>)")
+    parser.add_argument("--student", choices=STUDENTS, default="mobilenet")
+    parser.add_argument("--weights", default="imagenet", help="student backbone init: imagenet or none")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.5, help="weight of the hard-label loss")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", default=os.path.join(project_root, "models/student_model.h5"))
+    parser.add_argument("--report", default=os.path.join(project_root, "models/distillation_report.json"))
+    args = parser.parse_args()
+
+    weights = None if args.weights.lower() == "none" else args.weights
+    cache_dir = args.cache_dir or os.path.join(project_root, "data/cache",
+                                               os.path.basename(os.path.normpath(args.train_dir)))
+    _, history = distill(args.teacher, args.train_dir, args.output, cache_dir, args.student, weights,
+                         args.temperature, args.alpha, args.epochs, args.batch_size)
+
+    # Teacher first, so deltas and speedups are relative to it; each model is measured in a
+    # fresh process so peak memory is its own
+    from models.quantize import compare_backends
+    results = compare_backends([args.teacher, args.output], args.test_dir, args.batch_size)
+    report = {
+        "student": args.student, "temperature": args.temperature, "alpha": args.alpha,
+        "epochs_trained": len(history.history["loss"]),
+        "best_val_loss": float(min(history.history["val_loss"])),
+        "models": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
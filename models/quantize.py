@@ -0,0 +1,166 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.data_loader import list_images
+from utils.instrumentation import peak_rss_mb, wait_for_child
+from utils.preprocessing import preprocess_batch
+
+# Post-training quantization of final_model.h5 to TFLite, and a report comparing each
+# backend's accuracy, latency and memory on data/test.
+#
+#   python models/quantize.py export --model models/final_model.h5 --train-dir data/train
+#   python models/quantize.py report models/final_model.h5 models/final_model_dynamic.tflite ...
+
+MODES = ("dynamic", "int8", "float16")
+
+def calibration_batches(train_dir, num_images=100, batch_size=10, seed=42):
+    # Representative dataset for full-integer quantization: a stratified-enough random
+    # subset of data/train, preprocessed exactly as at serving time
+    paths, _, _ = list_images(train_dir)
+    rng = np.random.default_rng(seed)
+    paths = [paths[i] for i in rng.choice(len(paths), size=min(num_images, len(paths)), replace=False)]
+    for start in range(0, len(paths), batch_size):
+        for image in preprocess_batch(paths[start:start + batch_size]):
+            yield [image[np.newaxis]]
+
+def export_tflite(model_path, output_path, mode, train_dir=None, num_calibration=100):
+    # dynamic: int8 weights, float activations (no calibration needed)
+    # int8:    int8 weights and activations, calibrated on train_dir; float input/output kept
+    # float16: float16 weights
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path, compile=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == "int8":
+        if train_dir is None:
+            raise ValueError("int8 quantization needs train_dir for calibration")
+        converter.representative_dataset = lambda: calibration_batches(train_dir, num_calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != "dynamic":
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {MODES}")
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return output_path
+
+def _measure(model_path, test_dir, batch_size, threshold, num_threads, result_queue):
+    # Runs in a fresh process so peak RSS belongs to this backend alone
+    try:
+        result_queue.put(_measure_backend(model_path, test_dir, batch_size, threshold, num_threads))
+    except Exception as e:
+        result_queue.put({"model": os.path.basename(model_path), "error": repr(e)})
+
+def _measure_backend(model_path, test_dir, batch_size, threshold, num_threads):
+    from utils.backends import load_inference_model
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    model = load_inference_model(model_path, num_threads=num_threads) if model_path.endswith(".tflite") \
+        else load_inference_model(model_path)
+    load_seconds = time.perf_counter() - start
+
+    paths, labels, _ = list_images(test_dir)
+    probabilities = []
+    for start in range(0, len(paths), batch_size):
+        batch = preprocess_batch(paths[start:start + batch_size])
+        probabilities.append(np.asarray(model.predict(batch, batch_size=batch_size, verbose=0))[:, 0])
+    probabilities = np.concatenate(probabilities)
+
+    single = preprocess_batch(paths[:1])
+    model.predict(single, batch_size=1, verbose=0)
+    single_times = []
+    for _ in range(20):
+        start = time.perf_counter()
+        model.predict(single, batch_size=1, verbose=0)
+        single_times.append(time.perf_counter() - start)
+
+    batch = preprocess_batch((paths * batch_size)[:batch_size])
+    start = time.perf_counter()
+    for _ in range(3):
+        model.predict(batch, batch_size=batch_size, verbose=0)
+    batched_seconds = (time.perf_counter() - start) / 3
+
+    return {
+        "model": os.path.basename(model_path),
+        "file_mb": os.path.getsize(model_path) / 2**20,
+        "parameters": int(model.count_params()) if hasattr(model, "count_params") else None,
+        "load_seconds": load_seconds,
+        "accuracy": float(np.mean((probabilities > threshold) == labels)),
+        "single_image_ms_p50": float(np.median(single_times) * 1000),
+        "batched_images_per_sec": batch_size / batched_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_growth_mb": peak_rss_mb() - rss_before,
+        "probabilities": probabilities.tolist(),
+    }
+
+def compare_backends(model_paths, test_dir, batch_size=32, threshold=0.5, num_threads=None, timeout=None):
+    # timeout: seconds allowed per backend; a child that dies or overruns raises RuntimeError
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for model_path in model_paths:
+        result_queue = context.Queue()
+        process = context.Process(target=_measure,
+                                  args=(model_path, test_dir, batch_size, threshold, num_threads, result_queue))
+        process.start()
+        result = wait_for_child(process, result_queue, timeout)
+        if "error" in result:
+            raise RuntimeError(f"Measuring {model_path} failed: {result['error']}")
+        results.append(result)
+
+    # Accuracy delta and prediction agreement relative to the first (reference) model
+    reference = np.array(results[0]["probabilities"])
+    for result in results:
+        probabilities = np.array(result.pop("probabilities"))
+        result["accuracy_delta"] = result["accuracy"] - results[0]["accuracy"]
+        result["max_abs_probability_diff"] = float(np.max(np.abs(probabilities - reference)))
+        result["decision_agreement"] = float(np.mean((probabilities > threshold) == (reference > threshold)))
+        result["speedup_vs_reference"] = result["batched_images_per_sec"] / results[0]["batched_images_per_sec"]
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the trained model and compare CPU backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write quantized .tflite variants")
+    export.add_argument("--model", default=os.path.join(project_root, "models/final_model.h5"))
+    export.add_argument("--train-dir", default=os.path.join(project_root, "data/train"))
+    export.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    export.add_argument("--num-calibration", type=int, default=100)
+
+    report = commands.add_parser("report", help="accuracy / latency / memory for each model")
+    report.add_argument("models", nargs="+", help="reference model first, e.g. final_model.h5")
+    report.add_argument("--test-dir", default=os.path.join(project_root, "data/test"))
+    report.add_argument("--batch-size", type=int, default=32)
+    report.add_argument("--num-threads", type=int, default=None)
+    report.add_argument("--timeout", type=float, default=None, help="seconds allowed per model")
+    report.add_argument("--output", default=os.path.join(project_root, "models/quantization_report.json"))
+    args = parser.parse_args()
+
+    if args.command == "export":
+        stem = os.path.splitext(args.model)[0]
+        for mode in args.modes:
+            output_path = export_tflite(args.model, f"{stem}_{mode}.tflite", mode,
+                                        args.train_dir, args.num_calibration)
+            print(f"{mode}: {output_path} ({os.path.getsize(output_path) / 2**20:.1f} MB)")
+    else:
+        results = compare_backends(args.models, args.test_dir, args.batch_size, num_threads=args.num_threads,
+                                   timeout=args.timeout)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
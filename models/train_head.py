@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.data_loader import load_cached_data, load_split, save_split, split_indices
+
+# Trains build_model's head on cached ResNet50 features instead of the full network. The
+# backbone is frozen, so its pooled activations are computed once (extract_features) and
+# every epoch only runs the small Dense head; the trained head is then stitched back onto
+# the backbone (assemble_model), giving a model that serves like final_model.h5.
+#
+#   python models/train_head.py --train-dir data/train --epochs 50
+
+def train(train_dir, output_path, cache_dir, split_path, features_path, epochs=20, batch_size=32, patience=5):
+    from tensorflow.keras.callbacks import EarlyStopping
+    from models.custom_model import assemble_model, extract_features, train_head
+
+    images, labels = load_cached_data(train_dir, cache_dir)  # uint8 memmap
+    # Same persisted split as the training notebook, so the test rows stay unseen
+    if os.path.exists(split_path):
+        train_idx, val_idx, test_idx = load_split(split_path, labels)
+    else:
+        train_idx, val_idx, test_idx = split_indices(labels)
+        save_split(split_path, labels, train_idx, val_idx, test_idx)
+
+    features = extract_features(images, features_path, batch_size, images.shape[1:])
+    head, history = train_head(features, labels, train_idx, val_idx, epochs, batch_size,
+                               callbacks=[EarlyStopping(monitor="val_loss", patience=patience,
+                                                        restore_best_weights=True)])
+    test_loss, test_accuracy = head.evaluate(np.asarray(features[test_idx], dtype=np.float32), labels[test_idx],
+                                             batch_size=batch_size, verbose=0)
+
+    model = assemble_model(head, images.shape[1:])
+    model.save(output_path)
+    return {
+        "epochs_trained": len(history.history["loss"]),
+        "best_val_loss": float(min(history.history["val_loss"])),
+        "test_loss": float(test_loss),
+        "test_accuracy": float(test_accuracy),
+        "output": output_path,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the classifier head on cached backbone features")
+    parser.add_argument("--train-dir", default=os.path.join(project_root, "data/train"))
+    parser.add_argument("--cache-dir", default=None, help="uint8 image cache (default: data/cache/<train_dir name>)")
+    parser.add_argument("--split", default=os.path.join(project_root, "models/split.json"))
+    parser.add_argument("--features", default=None, help="feature cache (default: <cache dir>/features.npy)")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(project_root, "models/final_model.h5"))
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or os.path.join(project_root, "data/cache",
+                                               os.path.basename(os.path.normpath(args.train_dir)))
+    features_path = args.features or os.path.join(cache_dir, "features.npy")
+    report = train(args.train_dir, args.output, cache_dir, args.split, features_path, args.epochs,
+                   args.batch_size, args.patience)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from utils.micro_batcher import MicroBatcher
+from utils.preprocessing import load_image, normalize_batch
+
+# Local HTTP prediction service for final_model.h5.
+#   POST /predict   body: raw JPG/PNG bytes -> {"probability": ..., "prediction": ...}
+#   GET  /metrics   queue depth, batch-size histogram, p50/p99 latency
+#   GET  /health
+# Each request is decoded on its own handler thread; model calls are coalesced by MicroBatcher.
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    batcher = None
+    threshold = 0.5
+    max_body_bytes = 32 * 2**20
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, self.batcher.metrics())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "invalid Content-Length"})
+            return
+        if length > self.max_body_bytes:
+            self.close_connection = True  # the body is never read
+            self._send_json(413, {"error": f"body larger than {self.max_body_bytes} bytes"})
+            return
+
+        data = self.rfile.read(length)
+        image = load_image(data)
+        if image is None:
+            self._send_json(400, {"error": "could not decode image"})
+            return
+
+        try:
+            probability = float(self.batcher.predict(normalize_batch(image))[0])
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"probability": probability, "prediction": int(probability > self.threshold)})
+
+    def log_message(self, format, *args):
+        pass  # keep request logging off the hot path
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the trained model over HTTP with dynamic batching")
+    parser.add_argument("--model", default=os.path.join(project_root, "models/final_model.h5"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8500)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--max-body-mb", type=float, default=32, help="largest accepted request body")
+    args = parser.parse_args()
+
+    from utils.model_cache import get_model
+    model = get_model(args.model)
+
+    PredictionHandler.batcher = MicroBatcher(model.predict_on_batch, args.max_batch_size, args.max_wait_ms)
+    PredictionHandler.threshold = args.threshold
+    PredictionHandler.max_body_bytes = int(args.max_body_mb * 2**20)
+    server = ThreadingHTTPServer((args.host, args.port), PredictionHandler)
+    print(f"Serving {args.model} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        PredictionHandler.batcher.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import threading
+import numpy as np
+
+# CPU inference backends. TFLiteModel exposes the subset of the Keras Model API the app,
+# batch_score.py and serve.py use (predict / predict_on_batch), so a quantized .tflite
+# export can be dropped in wherever final_model.h5 is loaded.
+
+class TFLiteModel:
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+
+        self.model_path = model_path
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()  # an Interpreter must not be invoked concurrently
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = [batch_size] + list(self._input["shape"][1:])
+            self.interpreter.resize_tensor_input(self._input["index"], shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def _quantize(self, x, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] in (np.int8, np.uint8) and scale:
+            info = np.iinfo(details["dtype"])
+            return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(details["dtype"])
+        return x.astype(details["dtype"], copy=False)
+
+    def _dequantize(self, y, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] in (np.int8, np.uint8) and scale:
+            return (y.astype(np.float32) - zero_point) * scale
+        return y
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x)
+        with self._lock:
+            self._resize(len(x))
+            self.interpreter.set_tensor(self._input["index"], self._quantize(x, self._input))
+            self.interpreter.invoke()
+            y = self.interpreter.get_tensor(self._output["index"])
+        return self._dequantize(y, self._output)
+
+    def predict(self, x, batch_size=32, verbose=0):
+        # Fixed-size chunks (last one padded) so the interpreter isn't re-allocated per call
+        x = np.asarray(x)
+        outputs = []
+        for start in range(0, len(x), batch_size):
+            chunk = x[start:start + batch_size]
+            if len(chunk) < batch_size and len(x) > batch_size:
+                padded = np.zeros((batch_size,) + chunk.shape[1:], dtype=chunk.dtype)
+                padded[:len(chunk)] = chunk
+                outputs.append(self.predict_on_batch(padded)[:len(chunk)])
+            else:
+                outputs.append(self.predict_on_batch(chunk))
+        return np.concatenate(outputs) if outputs else np.empty((0, 1), dtype=np.float32)
+
+def load_inference_model(model_path, num_threads=None):
+    # Backend is chosen by file type: .tflite -> TFLite interpreter, anything else -> Keras
+    if model_path.endswith(".tflite"):
+        return TFLiteModel(model_path, num_threads=num_threads)
+
+    from tensorflow.keras.models import load_model
+    return load_model(model_path, compile=False)
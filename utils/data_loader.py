@@ -1,43 +1,345 @@
 import os
-import cv2
+import json
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from sklearn.model_selection import train_test_split
-
-def load_data(data_dir, img_size=(224, 224)):
-    images, labels = [], []
+from sklearn.model_selection import RepeatedStratifiedKFold, train_test_split
+from utils.instrumentation import stage
+from utils.preprocessing import IMAGE_EXTENSIONS, load_image, normalize_batch
 
+def get_label_map(data_dir):
     # Ensure consistent class order (e.g., ['benign', 'malignant'] or ['normal', 'cancer'])
-    class_names = sorted(os.listdir(data_dir))  
+    # Only sub-directories are classes; stray files next to them are ignored
+    class_names = sorted(
+        name for name in os.listdir(data_dir)
+        if os.path.isdir(os.path.join(data_dir, name))
+    )
 
     # Map folder names to numeric labels
-    label_map = {name: idx for idx, name in enumerate(class_names)}
+    return {name: idx for idx, name in enumerate(class_names)}
+
+def list_images(data_dir):
+    label_map = get_label_map(data_dir)
+    paths, labels = [], []
+
+    for category, label in label_map.items():
+        category_path = os.path.join(data_dir, category)
+        for file in sorted(os.listdir(category_path)):
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue  # skip placeholders and other non-image files
+            paths.append(os.path.join(category_path, file))
+            labels.append(label)
+
+    return paths, np.array(labels, dtype=np.int32), label_map
+
+def load_data(data_dir, img_size=(224, 224)):
+    # (N, H, W, 3) float32 images in [0, 1] and int32 labels, all decoded into memory
+    with stage("load_data", data_dir=data_dir, cached=False):
+        return _load_data(data_dir, img_size)
+
+def load_cached_data(data_dir, cache_dir, img_size=(224, 224)):
+    # (N, H, W, 3) uint8 images memory-mapped from the on-disk cache (only changed files are
+    # re-decoded) and int32 labels. Not normalized: callers scale per batch with
+    # normalize_batch, iter_batches or batch_sequence.
+    with stage("load_data", data_dir=data_dir, cached=True):
+        return open_cache(build_cache(data_dir, cache_dir, img_size))
+
+def _load_data(data_dir, img_size):
+    images, labels = [], []
+
+    label_map = get_label_map(data_dir)
     print("Label Mapping:", label_map)  # Debug: show class-to-index mapping
 
-    for category in class_names:
+    for category in label_map:
         category_path = os.path.join(data_dir, category)
         for file in os.listdir(category_path):
             img_path = os.path.join(category_path, file)
-            img = cv2.imread(img_path)
+            img = load_image(img_path, img_size)
 
             if img is None:
                 continue  # skip broken or unreadable images
 
-            img = cv2.resize(img, img_size)
             images.append(img)
             labels.append(label_map[category])  # Use mapped integer label
 
     # Convert to numpy arrays
-    images = np.array(images, dtype=np.float32) / 255.0  # Normalize pixel values
+    images = normalize_batch(np.array(images, dtype=np.uint8))  # Normalize pixel values
     labels = np.array(labels, dtype=np.int32)            # Ensure labels are integers (not one-hot)
 
     return images, labels
 
-def split_data(images, labels, test_size=0.2, val_size=0.1):
-    # Split into training + temp test
-    X_train, X_temp, y_train, y_temp = train_test_split(images, labels, test_size=test_size, random_state=42, stratify=labels)
+def stream_data(data_dir, img_size=(224, 224), batch_size=32, num_workers=None,
+                prefetch=2, shuffle=False, seed=42, epoch=0):
+    # Yields (uint8 images, int32 labels) batches. Decoding and resizing run on a
+    # thread pool (OpenCV releases the GIL); at most `prefetch` batches are decoded
+    # ahead of the consumer, so memory stays bounded regardless of dataset size.
+    # The shuffle order depends on (seed, epoch): reproducible, but different every pass.
+    paths, labels, label_map = list_images(data_dir)
+    print("Label Mapping:", label_map)
+
+    order = np.arange(len(paths))
+    if shuffle:
+        np.random.default_rng((seed, epoch)).shuffle(order)
+    chunks = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    pool = ThreadPoolExecutor(max_workers=num_workers)
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append((chunk, [pool.submit(load_image, paths[i], img_size) for i in chunk]))
+            if len(pending) <= prefetch:
+                continue
+            yield _collect_batch(*pending.popleft(), labels, img_size)
+        while pending:
+            yield _collect_batch(*pending.popleft(), labels, img_size)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _collect_batch(chunk, futures, labels, img_size):
+    decoded = [(i, f.result()) for i, f in zip(chunk, futures)]
+    decoded = [(i, img) for i, img in decoded if img is not None]
+    if not decoded:
+        return np.empty((0, img_size[1], img_size[0], 3), dtype=np.uint8), np.empty((0,), dtype=np.int32)
+
+    batch = np.empty((len(decoded),) + decoded[0][1].shape, dtype=np.uint8)
+    for row, (_, img) in enumerate(decoded):
+        batch[row] = img
+    return batch, labels[[i for i, _ in decoded]]
+
+CACHE_IMAGES = "images.npy"
+CACHE_LABELS = "labels.npy"
+CACHE_MANIFEST = "manifest.json"
+SKIPPED = -1
+
+def _file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    if not all(os.path.exists(os.path.join(cache_dir, name)) for name in (CACHE_MANIFEST, CACHE_IMAGES, CACHE_LABELS)):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def build_cache(data_dir, cache_dir, img_size=(224, 224), num_workers=None):
+    # Writes resized uint8 images + labels into one .npy store under cache_dir, plus a
+    # manifest of (path, size, mtime, sha1) per row. Rows whose source file is unchanged
+    # are copied from the previous store; only new or modified files are decoded again.
+    os.makedirs(cache_dir, exist_ok=True)
+    paths, labels, label_map = list_images(data_dir)
+    old = _read_manifest(cache_dir)
+    if old is not None and (old["img_size"] != list(img_size) or old["label_map"] != label_map):
+        old = None  # different geometry or classes, rebuild everything
+    old_files = {entry["path"]: entry for entry in old["files"]} if old else {}
+
+    # sources[i] is an old row index to copy, SKIPPED for a known-unreadable file,
+    # or None if the file must be decoded
+    entries, sources = [], []
+    for img_path, label in zip(paths, labels):
+        rel_path = os.path.relpath(img_path, data_dir)
+        stat = os.stat(img_path)
+        entry = {"path": rel_path, "label": int(label), "size": stat.st_size, "mtime": stat.st_mtime}
+        prev = old_files.get(rel_path)
+        if prev is not None and prev["size"] == entry["size"] and prev["mtime"] == entry["mtime"]:
+            entry["sha1"] = prev["sha1"]
+        else:
+            entry["sha1"] = _file_hash(img_path)
+        reuse = prev is not None and prev["sha1"] == entry["sha1"] and prev["label"] == entry["label"]
+        entries.append(entry)
+        sources.append(prev["row"] if reuse else None)
+
+    if old is not None and all(src is not None for src in sources) and \
+            [src for src in sources if src != SKIPPED] == list(range(old["rows"])):
+        return cache_dir  # nothing added, removed or changed
+
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        decoded = {
+            i: pool.submit(load_image, os.path.join(data_dir, entries[i]["path"]), img_size)
+            for i, src in enumerate(sources) if src is None
+        }
+        decoded = {i: f.result() for i, f in decoded.items()}
+
+    for i, img in decoded.items():
+        if img is None:
+            sources[i] = SKIPPED  # remembered so unreadable files are not retried every build
+    keep = [i for i, src in enumerate(sources) if src != SKIPPED]
+
+    images_path = os.path.join(cache_dir, CACHE_IMAGES)
+    tmp_path = images_path + ".tmp.npy"
+    old_images = np.load(images_path, mmap_mode="r") if old is not None else None
+    store = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.uint8, shape=(len(keep), img_size[1], img_size[0], 3)
+    )
+    for row, i in enumerate(keep):
+        store[row] = decoded[i] if sources[i] is None else old_images[sources[i]]
+    store.flush()
+    del store, old_images
+
+    rows = {i: row for row, i in enumerate(keep)}
+    for i, entry in enumerate(entries):
+        entry["row"] = rows.get(i, SKIPPED)
+    labels_path = os.path.join(cache_dir, CACHE_LABELS)
+    manifest_path = os.path.join(cache_dir, CACHE_MANIFEST)
+    np.save(labels_path + ".tmp.npy", labels[keep])
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"img_size": list(img_size), "label_map": label_map, "rows": len(keep), "files": entries}, f)
+    # Every file is complete before anything is swapped in. The old manifest goes first and
+    # the new one lands last, so an interrupted swap leaves no manifest (a full rebuild next
+    # time) rather than one describing a mix of old and new data files.
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    os.replace(tmp_path, images_path)
+    os.replace(labels_path + ".tmp.npy", labels_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    reused = sum(1 for i in keep if sources[i] is not None)
+    print(f"Cache: {len(keep) - reused} decoded, {reused} reused, {len(entries) - len(keep)} unreadable")
+    return cache_dir
+
+def open_cache(cache_dir):
+    # Zero-copy open: images are a read-only uint8 memmap, nothing is decoded
+    images = np.load(os.path.join(cache_dir, CACHE_IMAGES), mmap_mode="r")
+    labels = np.load(os.path.join(cache_dir, CACHE_LABELS))
+    return images, labels
+
+def cached_files(cache_dir):
+    # Source path (relative to data_dir) of every row in the store, in row order
+    with open(os.path.join(cache_dir, CACHE_MANIFEST)) as f:
+        files = json.load(f)["files"]
+    paths = [None] * sum(1 for entry in files if entry["row"] != SKIPPED)
+    for entry in files:
+        if entry["row"] != SKIPPED:
+            paths[entry["row"]] = entry["path"]
+    return paths
+
+def make_tf_dataset(data_dir, img_size=(224, 224), batch_size=32, num_workers=None, shuffle=True):
+    # tf.data wrapper around stream_data for model.fit; normalization happens lazily in the graph
+    import tensorflow as tf
+
+    epochs = itertools.count()  # tf.data calls generator() once per epoch
+
+    def generator():
+        for images, labels in stream_data(data_dir, img_size, batch_size, num_workers, shuffle=shuffle,
+                                          epoch=next(epochs)):
+            if len(images):
+                yield images, labels
+
+    dataset = tf.data.Dataset.from_generator(
+        generator,
+        output_signature=(
+            tf.TensorSpec(shape=(None, img_size[1], img_size[0], 3), dtype=tf.uint8),
+            tf.TensorSpec(shape=(None,), dtype=tf.int32),
+        ),
+    )
+    dataset = dataset.map(lambda x, y: (tf.cast(x, tf.float32) / 255.0, y),
+                          num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def split_indices(labels, test_size=0.2, val_size=0.1, seed=42):
+    # Stratified split over row indices only; the image tensor is never touched.
+    # Uses the same two-step train_test_split as split_data, so the partition is identical.
+    indices = np.arange(len(labels))
+    train_idx, temp_idx = train_test_split(indices, test_size=test_size, random_state=seed, stratify=labels)
 
-    # Split temp into validation and test
     val_ratio = val_size / (1 - test_size)  # adjust val size relative to remaining
-    X_val, X_test, y_val, y_test = train_test_split(X_temp, y_temp, test_size=1 - val_ratio, random_state=42, stratify=y_temp)
+    val_idx, test_idx = train_test_split(temp_idx, test_size=1 - val_ratio, random_state=seed, stratify=labels[temp_idx])
+
+    return np.sort(train_idx), np.sort(val_idx), np.sort(test_idx)
+
+def kfold_indices(labels, folds=5, repeats=1, val_size=0.1, seed=42):
+    # Stratified (repeated) k-fold over row indices. Each fold's held-out part is its test
+    # set; a stratified val_size share of the rest is held back for early stopping.
+    splitter = RepeatedStratifiedKFold(n_splits=folds, n_repeats=repeats, random_state=seed)
+    splits = []
+    for i, (rest_idx, test_idx) in enumerate(splitter.split(np.zeros(len(labels)), labels)):
+        train_idx, val_idx = train_test_split(rest_idx, test_size=val_size / (1 - 1 / folds),
+                                              random_state=seed + i, stratify=labels[rest_idx])
+        splits.append({"repeat": i // folds, "fold": i % folds,
+                       "train": np.sort(train_idx), "val": np.sort(val_idx), "test": np.sort(test_idx)})
+    return splits
+
+def array_digest(array, block_rows=256):
+    # SHA-1 over an array's shape, dtype and contents, read in row blocks so a memmap is
+    # hashed without loading it whole. Keys derived caches (features, teacher logits).
+    digest = hashlib.sha1(f"{array.shape}:{array.dtype}".encode())
+    for start in range(0, len(array), block_rows):
+        digest.update(np.ascontiguousarray(array[start:start + block_rows]).tobytes())
+    return digest.hexdigest()
 
-    return X_train, X_val, X_test, y_train, y_val, y_test
+def _labels_digest(labels):
+    return hashlib.sha1(np.ascontiguousarray(labels, dtype=np.int32).tobytes()).hexdigest()
+
+def save_split(path, labels, train_idx, val_idx, test_idx, seed=42):
+    # Persist the split so evaluation reuses exactly the same test rows
+    manifest = {
+        "seed": seed,
+        "num_samples": int(len(labels)),
+        "labels_sha1": _labels_digest(labels),
+        "train": [int(i) for i in train_idx],
+        "val": [int(i) for i in val_idx],
+        "test": [int(i) for i in test_idx],
+    }
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+def load_split(path, labels=None):
+    with open(path) as f:
+        manifest = json.load(f)
+
+    # Guard against applying a split to a dataset that changed since it was written
+    if labels is not None and (manifest["num_samples"] != len(labels) or
+                               manifest["labels_sha1"] != _labels_digest(labels)):
+        raise ValueError(f"Split manifest {path} does not match the loaded dataset; rebuild the split.")
+
+    return tuple(np.array(manifest[name], dtype=np.int64) for name in ("train", "val", "test"))
+
+def iter_batches(images, labels, indices, batch_size=32, shuffle=False, seed=42, epoch=0):
+    # Yields normalized float32 batches for the given rows; works on plain arrays and memmaps.
+    # Indices are sorted within a batch so memmap reads stay sequential. Pass the epoch
+    # number so each pass is shuffled differently.
+    indices = np.asarray(indices)
+    if shuffle:
+        indices = np.random.default_rng((seed, epoch)).permutation(indices)
+    for start in range(0, len(indices), batch_size):
+        batch_idx = np.sort(indices[start:start + batch_size])
+        yield normalize_batch(images[batch_idx]), labels[batch_idx]
+
+def batch_sequence(images, labels, indices, batch_size=32, shuffle=False, seed=42):
+    # keras Sequence over iter_batches-style batches for model.fit: rows are normalized one
+    # batch at a time (memmap or shared memory in, float32 batch out), reshuffled every epoch.
+    # labels may be 2-D, e.g. (hard label, teacher logit) pairs for distillation.
+    from tensorflow.keras.utils import Sequence
+
+    class BatchSequence(Sequence):
+        def __init__(self):
+            super().__init__()
+            self.epoch = 0
+            self.order = np.asarray(indices)
+
+        def __len__(self):
+            return (len(indices) + batch_size - 1) // batch_size
+
+        def __getitem__(self, i):
+            batch_idx = np.sort(self.order[i * batch_size:(i + 1) * batch_size])
+            return normalize_batch(images[batch_idx]), labels[batch_idx]
+
+        def on_epoch_end(self):
+            if shuffle:
+                self.epoch += 1
+                self.order = np.random.default_rng(seed + self.epoch).permutation(indices)
+
+    sequence = BatchSequence()
+    sequence.on_epoch_end()
+    return sequence
+
+def split_data(images, labels, test_size=0.2, val_size=0.1):
+    # Index-based, so only the returned subsets are copied (no intermediate X_temp)
+    train_idx, val_idx, test_idx = split_indices(labels, test_size, val_size)
+    return (images[train_idx], images[val_idx], images[test_idx],
+            labels[train_idx], labels[val_idx], labels[test_idx])
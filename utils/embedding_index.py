@@ -0,0 +1,264 @@
+import atexit
+import os
+import threading
+import numpy as np
+from utils.instrumentation import stage
+from utils.preprocessing import decode_batches, normalize_batch
+
+# Similar-case retrieval over the model's penultimate layer (the Dense(512) block of
+# build_model). Vectors are L2-normalized, so the inner product is cosine similarity.
+# Search is exact brute force by default; build_ivf() adds an inverted-file index
+# (k-means coarse quantizer) for large corpora, searched with nprobe > 0.
+
+BLOCK_ROWS = 65536  # corpus rows scored per matmul block, bounds the similarity buffer
+SAVE_DELAY = 30.0  # seconds save_in_background waits, so a burst of inserts is one write
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+def embedding_model(model):
+    # Sub-model returning the input of the classifier layer; built once per loaded model
+    key = id(model)
+    with _embedders_lock:
+        if key not in _embedders:
+            if not hasattr(model, "layers"):
+                raise TypeError("Embeddings need the Keras model; quantized .tflite models have no penultimate output.")
+            from tensorflow.keras.models import Model
+            # Skip trailing weightless layers, e.g. the separate sigmoid after a distilled student's logits
+            classifier = next(layer for layer in reversed(model.layers) if layer.weights)
+            _embedders[key] = Model(inputs=model.inputs, outputs=classifier.input)
+        return _embedders[key]
+
+def embed(model, images, batch_size=32):
+    # (N, D) float32 embeddings for a normalized float32 image batch
+    embedder = embedding_model(model)
+    with stage("embed", images=len(images)):
+        return np.concatenate([embedder.predict_on_batch(images[start:start + batch_size])
+                               for start in range(0, len(images), batch_size)]).astype(np.float32)
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _top_k(scores, k):
+    # Row-wise indices of the k largest scores, best first, without a full sort
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+class EmbeddingIndex:
+    def __init__(self, dim, model_version=""):
+        self.dim = dim
+        self.model_version = model_version
+        self.size = 0
+        self._vectors = np.empty((0, dim), dtype=np.float32)  # grown by doubling, first `size` rows valid
+        self.labels = np.empty((0,), dtype=np.int32)
+        self.paths = []
+        self.sources = []  # "train" for labelled corpus rows, "scored" for inserted predictions
+        self.digests = []  # content digest per row ("" if unknown); a digest is inserted once
+        self._digest_set = set()
+        self._scored = np.empty((0,), dtype=bool)  # sources == "scored", for search filtering
+        self.centroids = None  # IVF quantizer, None until build_ivf()
+        self._lists = np.empty((0,), dtype=np.int32)  # IVF list of every row
+        self._lock = threading.Lock()
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.size]
+
+    def add(self, vectors, labels, paths, source="train", digests=None):
+        # Rows whose digest is already in the index are skipped; returns the number added
+        vectors = _normalize(vectors)
+        labels = np.asarray(labels, dtype=np.int32)
+        paths = list(paths)
+        digests = [""] * len(vectors) if digests is None else list(digests)
+        with self._lock:
+            keep = [i for i, digest in enumerate(digests) if not digest or digest not in self._digest_set]
+            if len(keep) < len(vectors):
+                vectors, labels = vectors[keep], labels[keep]
+                paths, digests = [paths[i] for i in keep], [digests[i] for i in keep]
+            if not keep:
+                return 0
+            needed = self.size + len(vectors)
+            if needed > len(self._vectors):
+                capacity = max(needed, 2 * len(self._vectors), 1024)
+                grown = np.empty((capacity, self.dim), dtype=np.float32)
+                grown[:self.size] = self.vectors
+                self._vectors = grown
+            self._vectors[self.size:needed] = vectors
+            self.labels = np.concatenate([self.labels, labels])
+            self.paths += paths
+            self.sources += [source] * len(vectors)
+            self.digests += digests
+            self._digest_set.update(digest for digest in digests if digest)
+            self._scored = np.concatenate([self._scored, np.full((len(vectors),), source == "scored")])
+            if self.centroids is not None:  # new rows join their nearest list, no retraining
+                self._lists = np.concatenate([self._lists, np.argmax(vectors @ self.centroids.T, axis=1)])
+            self.size = needed
+        return len(vectors)
+
+    def build_ivf(self, num_lists=None, iterations=10, seed=42):
+        # Spherical k-means over the current vectors; sqrt(N) lists by default
+        with self._lock:
+            vectors = self.vectors
+            num_lists = min(num_lists or max(int(np.sqrt(self.size)), 1), self.size)
+            rng = np.random.default_rng(seed)
+            centroids = vectors[rng.choice(self.size, num_lists, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(vectors @ centroids.T, axis=1)
+                for c in range(num_lists):
+                    members = vectors[assignment == c]
+                    if len(members):
+                        centroids[c] = members.sum(axis=0)
+                centroids = _normalize(centroids)
+            self.centroids = centroids
+            self._lists = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+    def search(self, queries, k=5, nprobe=0, include_scored=False):
+        # Returns (row indices, cosine similarities), each (Q, k) and best first; missing
+        # results are -1 / -inf. nprobe > 0 searches only that many IVF lists per query
+        # (approximate). Model-scored rows are labelled by the model's own prediction,
+        # so they are left out unless include_scored.
+        queries = _normalize(queries)
+        with self._lock:
+            excluded = None if include_scored or not self._scored.any() else self._scored
+            if nprobe and self.centroids is not None:
+                return self._search_ivf(queries, k, nprobe, excluded)
+            return self._search_exact(queries, k, excluded)
+
+    def lookup(self, queries, k=5, nprobe=0, include_scored=False):
+        # search() as one list of {path, label, source, similarity} dicts per query
+        indices, scores = self.search(queries, k, nprobe, include_scored)
+        return [[{"path": self.paths[i], "label": int(self.labels[i]), "source": self.sources[i],
+                  "similarity": float(score)} for i, score in zip(row, row_scores) if i >= 0 and np.isfinite(score)]
+                for row, row_scores in zip(indices, scores)]
+
+    def _search_exact(self, queries, k, excluded=None):
+        best_idx = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.size, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, self.size)
+            scores = queries @ self._vectors[start:stop].T
+            if excluded is not None:
+                scores[:, excluded[start:stop]] = -np.inf
+            top = _top_k(scores, k)
+            candidates = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            indices = np.concatenate([best_idx, top + start], axis=1)
+            keep = _top_k(candidates, k)
+            best_idx = np.take_along_axis(indices, keep, axis=1)
+            best_scores = np.take_along_axis(candidates, keep, axis=1)
+        return best_idx, best_scores
+
+    def _search_ivf(self, queries, k, nprobe, excluded=None):
+        probes = _top_k(queries @ self.centroids.T, nprobe)
+        results_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        results_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            member = np.isin(self._lists, lists)
+            if excluded is not None:
+                member &= ~excluded
+            rows = np.flatnonzero(member)
+            scores = self._vectors[rows] @ queries[q]
+            top = _top_k(scores[np.newaxis], k)[0]
+            results_idx[q, :len(top)] = rows[top]
+            results_scores[q, :len(top)] = scores[top]
+        return results_idx, results_scores
+
+    def save(self, path):
+        # Single .npz written to a temp file and renamed, so readers never see a partial index
+        with self._lock:
+            arrays = {
+                "vectors": self.vectors, "labels": self.labels,
+                "paths": np.array(self.paths, dtype=str), "sources": np.array(self.sources, dtype=str),
+                "digests": np.array(self.digests, dtype=str),
+                "model_version": np.array(self.model_version),
+            }
+            if self.centroids is not None:
+                arrays.update(centroids=self.centroids, lists=self._lists)
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(data["vectors"].shape[1], str(data["model_version"]))
+            index._vectors = data["vectors"].copy()
+            index.size = len(index._vectors)
+            index.labels = data["labels"]
+            index.paths = data["paths"].tolist()
+            index.sources = data["sources"].tolist()
+            # Indexes saved before digests were stored have none
+            index.digests = data["digests"].tolist() if "digests" in data else [""] * index.size
+            index._digest_set = {digest for digest in index.digests if digest}
+            index._scored = np.array(index.sources, dtype=str) == "scored"
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                index._lists = data["lists"]
+        return index
+
+def build_index(model, paths, labels, model_version="", batch_size=32, workers=None):
+    # Embeds labelled images (e.g. list_images("data/train")); undecodable files are skipped
+    index = None
+    labels = np.asarray(labels)
+    label_of = dict(zip(paths, labels))
+    for chunk, images in decode_batches(list(paths), batch_size, workers):
+        kept = [(path, img) for path, img in zip(chunk, images) if img is not None]
+        if not kept:
+            continue
+        vectors = embed(model, normalize_batch(np.stack([img for _, img in kept])), batch_size)
+        if index is None:
+            index = EmbeddingIndex(vectors.shape[1], model_version)
+        index.add(vectors, [label_of[path] for path, _ in kept], [os.path.abspath(path) for path, _ in kept])
+    return index
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_save_lock = threading.Lock()
+_pending_saves = {}  # index_path -> (index, timer) of the save scheduled for it
+_pending_lock = threading.Lock()
+
+def get_index(index_path, model_version=None):
+    # Process-wide index, loaded once like the model; None if it hasn't been built
+    # or was built from different weights than the ones being served. A missing index
+    # isn't cached, so one built after the app started is picked up on the next call.
+    with _indexes_lock:
+        if index_path not in _indexes and os.path.exists(index_path):
+            _indexes[index_path] = EmbeddingIndex.load(index_path)
+        index = _indexes.get(index_path)
+    if index is not None and model_version is not None and index.model_version != model_version:
+        return None
+    return index
+
+def _save_now(index_path):
+    with _pending_lock:
+        index, _ = _pending_saves.pop(index_path, (None, None))
+    if index is not None:
+        with _save_lock:
+            index.save(index_path)
+
+def save_in_background(index, index_path, delay=SAVE_DELAY):
+    # Persists inserted rows without blocking the caller. Saves are debounced: calls
+    # within `delay` seconds of a scheduled save share it, so the .npz is rewritten at
+    # most once per delay however many rows are added. Pending saves also run at exit.
+    with _pending_lock:
+        if index_path in _pending_saves:
+            return _pending_saves[index_path][1]
+        timer = threading.Timer(delay, _save_now, args=(index_path,))
+        timer.name, timer.daemon = "index-save", True
+        _pending_saves[index_path] = (index, timer)
+    timer.start()
+    return timer
+
+@atexit.register
+def flush_saves():
+    # Writes every pending debounced save now
+    with _pending_lock:
+        pending = list(_pending_saves.items())
+    for index_path, (_, timer) in pending:
+        timer.cancel()
+        _save_now(index_path)
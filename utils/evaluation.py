@@ -0,0 +1,176 @@
+import csv
+import os
+import numpy as np
+from utils.preprocessing import decode_batches, normalize_batch
+
+# Memory-bounded evaluation. Images are streamed from disk in batches, metrics are
+# accumulated incrementally, and every prediction is cached per file (keyed by size,
+# mtime and model version) so re-evaluating skips the model. Other thresholds don't need
+# another pass at all: StreamingMetrics.result(threshold) reads them off the histogram.
+
+class StreamingMetrics:
+    # Accumulates a fine probability histogram per class plus calibration sums. The
+    # confusion matrix at `threshold` is exact; ROC-AUC and other thresholds are computed
+    # from the histogram at 1 / num_bins resolution.
+
+    def __init__(self, threshold=0.5, num_bins=1000, calibration_bins=10):
+        self.threshold = threshold
+        self.num_bins = num_bins
+        self.calibration_bins = calibration_bins
+        self.histogram = np.zeros((2, num_bins), dtype=np.int64)  # [label, probability bin]
+        self.confusion = np.zeros((2, 2), dtype=np.int64)         # [[tn, fp], [fn, tp]]
+        self.calibration_count = np.zeros(calibration_bins, dtype=np.int64)
+        self.calibration_prob = np.zeros(calibration_bins, dtype=np.float64)
+        self.calibration_pos = np.zeros(calibration_bins, dtype=np.float64)
+        self.log_loss_sum = 0.0
+
+    def update(self, probabilities, labels):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.int64)
+
+        bins = np.minimum((probabilities * self.num_bins).astype(np.int64), self.num_bins - 1)
+        np.add.at(self.histogram, (labels, bins), 1)
+        predicted = (probabilities > self.threshold).astype(np.int64)
+        np.add.at(self.confusion, (labels, predicted), 1)
+
+        cal = np.minimum((probabilities * self.calibration_bins).astype(np.int64), self.calibration_bins - 1)
+        self.calibration_count += np.bincount(cal, minlength=self.calibration_bins)
+        self.calibration_prob += np.bincount(cal, weights=probabilities, minlength=self.calibration_bins)
+        self.calibration_pos += np.bincount(cal, weights=labels, minlength=self.calibration_bins)
+
+        clipped = np.clip(probabilities, 1e-7, 1 - 1e-7)
+        self.log_loss_sum -= float(np.sum(labels * np.log(clipped) + (1 - labels) * np.log(1 - clipped)))
+
+    def confusion_matrix(self, threshold=None):
+        if threshold is None or threshold == self.threshold:
+            return self.confusion.copy()
+        # Bins entirely above the threshold count as positive
+        first_positive = int(np.floor(threshold * self.num_bins + 1e-9)) + 1
+        positives = self.histogram[:, first_positive:].sum(axis=1)
+        totals = self.histogram.sum(axis=1)
+        return np.array([[totals[0] - positives[0], positives[0]],
+                         [totals[1] - positives[1], positives[1]]], dtype=np.int64)
+
+    def roc_auc(self):
+        negatives, positives = self.histogram[0][::-1], self.histogram[1][::-1]  # high -> low probability
+        if positives.sum() == 0 or negatives.sum() == 0:
+            return None
+        tp_before = np.concatenate([[0], np.cumsum(positives)[:-1]])
+        # Trapezoid per bin: ties inside a bin contribute half
+        return float(np.sum(negatives * (tp_before + positives / 2.0)) / (positives.sum() * negatives.sum()))
+
+    def calibration(self):
+        rows = []
+        for i in range(self.calibration_bins):
+            count = int(self.calibration_count[i])
+            rows.append({
+                "bin": f"{i / self.calibration_bins:.1f}-{(i + 1) / self.calibration_bins:.1f}",
+                "count": count,
+                "mean_probability": self.calibration_prob[i] / count if count else None,
+                "fraction_positive": self.calibration_pos[i] / count if count else None,
+            })
+        return rows
+
+    def result(self, threshold=None):
+        (tn, fp), (fn, tp) = self.confusion_matrix(threshold)
+        total = int(self.histogram.sum())
+        ece = float(np.sum(np.abs(self.calibration_prob - self.calibration_pos)) / total) if total else None
+        return {
+            "threshold": self.threshold if threshold is None else threshold,
+            "samples": total,
+            "confusion_matrix": [[int(tn), int(fp)], [int(fn), int(tp)]],
+            "accuracy": (tp + tn) / total if total else None,
+            "sensitivity": tp / (tp + fn) if tp + fn else None,
+            "specificity": tn / (tn + fp) if tn + fp else None,
+            "precision": tp / (tp + fp) if tp + fp else None,
+            "roc_auc": self.roc_auc(),
+            "log_loss": self.log_loss_sum / total if total else None,
+            "expected_calibration_error": ece,
+            "calibration": self.calibration(),
+        }
+
+class PredictionFileCache:
+    # Per-file predictions in a CSV; an entry is valid while the file's size and mtime and
+    # the model version are unchanged. New rows are appended and flushed batch by batch.
+    # Rescoring (new model version, changed file) appends a row that supersedes the old
+    # one; once superseded rows outnumber live ones the file is compacted on load.
+    FIELDS = ["path", "size", "mtime", "model_version", "probability"]
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        rows = 0
+        if os.path.exists(cache_path):
+            with open(cache_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self.entries[row["path"]] = row  # later rows win
+                    rows += 1
+        if rows - len(self.entries) > len(self.entries):
+            self.compact()
+
+    def compact(self):
+        # Rewrites the CSV with one row per file still on disk; temp file + rename
+        self.entries = {path: row for path, row in self.entries.items() if os.path.exists(path)}
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.entries.values())
+        os.replace(tmp_path, self.cache_path)
+
+    def get(self, path, model_version):
+        entry = self.entries.get(path)
+        if entry is None or entry["model_version"] != model_version:
+            return None
+        stat = os.stat(path)
+        if int(entry["size"]) != stat.st_size or float(entry["mtime"]) != stat.st_mtime:
+            return None
+        return float(entry["probability"])
+
+    def put_many(self, paths, probabilities, model_version):
+        new_file = not os.path.exists(self.cache_path)
+        with open(self.cache_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+            if new_file:
+                writer.writeheader()
+            for path, probability in zip(paths, probabilities):
+                stat = os.stat(path)
+                row = {"path": path, "size": stat.st_size, "mtime": repr(stat.st_mtime),
+                       "model_version": model_version, "probability": repr(float(probability))}
+                writer.writerow(row)
+                self.entries[path] = row
+
+def evaluate(model, paths, labels, cache_path=None, model_version="", threshold=0.5,
+             batch_size=32, workers=None):
+    # Returns (StreamingMetrics, per-file probabilities); unreadable files get NaN and are
+    # left out of the metrics. Only files missing from the cache go through the model.
+    labels = np.asarray(labels)
+    probabilities = np.full(len(paths), np.nan, dtype=np.float32)
+    metrics = StreamingMetrics(threshold)
+    cache = PredictionFileCache(cache_path) if cache_path else None
+
+    todo = []
+    for i, path in enumerate(paths):
+        cached = cache.get(path, model_version) if cache else None
+        if cached is None:
+            todo.append(i)
+        else:
+            probabilities[i] = cached
+    done = np.flatnonzero(~np.isnan(probabilities))
+    if len(done):
+        metrics.update(probabilities[done], labels[done])
+
+    index_of = {paths[i]: i for i in todo}
+    for chunk, images in decode_batches([paths[i] for i in todo], batch_size, workers):
+        ok = [j for j, img in enumerate(images) if img is not None]
+        if not ok:
+            continue
+        batch = normalize_batch(np.stack([images[j] for j in ok]))
+        batch_probabilities = np.asarray(model.predict_on_batch(batch))[:, 0]
+        rows = [index_of[chunk[j]] for j in ok]
+        probabilities[rows] = batch_probabilities
+        metrics.update(batch_probabilities, labels[rows])
+        if cache:
+            cache.put_many([chunk[j] for j in ok], batch_probabilities, model_version)
+
+    return metrics, probabilities
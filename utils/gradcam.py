@@ -0,0 +1,119 @@
+import threading
+import time
+import numpy as np
+from utils.instrumentation import stage
+from utils.prediction_cache import PredictionCache, content_hash
+from utils.preprocessing import normalize_batch
+
+# Grad-CAM over the last convolutional block (conv5_block3_out of the ResNet50 backbone in
+# build_model). A whole batch of slices is explained with one forward and one backward
+# pass: each sample's output depends only on its own input, so the gradient of the summed
+# outputs gives every sample's own gradient. Heatmaps are kept at conv resolution (7x7 for
+# 224x224 input) in an LRU keyed by model version and image hash, so revisiting a result
+# costs only the overlay, which is done for the whole batch in NumPy.
+
+LAST_CONV_LAYER = "conv5_block3_out"
+
+heatmap_cache = PredictionCache(max_entries=2000)
+
+_heatmap_fns = {}
+_heatmap_fns_lock = threading.Lock()
+_colormap = None
+
+def _conv_layer(model, layer_name=None):
+    if layer_name is not None:
+        return model.get_layer(layer_name)
+    names = [layer.name for layer in model.layers]
+    if LAST_CONV_LAYER in names:
+        return model.get_layer(LAST_CONV_LAYER)
+    # Other architectures: the last layer with a spatial (N, H, W, C) output
+    for layer in reversed(model.layers):
+        if len(layer.output.shape) == 4:
+            return layer
+    raise ValueError("Model has no convolutional feature map to explain")
+
+def _build_heatmap_fn(model, layer_name):
+    import tensorflow as tf
+    from tensorflow.keras.models import Model
+
+    grad_model = Model(inputs=model.inputs, outputs=[_conv_layer(model, layer_name).output, model.output])
+
+    # Traced once for any batch size, so CPU calls run as a graph rather than op by op
+    @tf.function(input_signature=[tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32)])
+    def heatmaps(images):
+        with tf.GradientTape() as tape:
+            features, predictions = grad_model(images, training=False)
+            score = tf.reduce_sum(predictions[:, 0])
+        grads = tape.gradient(score, features)
+        weights = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)  # channel importance per sample
+        cams = tf.nn.relu(tf.reduce_sum(weights * features, axis=-1))
+        peak = tf.reduce_max(cams, axis=(1, 2), keepdims=True)
+        return cams / tf.maximum(peak, 1e-8)
+
+    return heatmaps
+
+def heatmap_fn(model, layer_name=None):
+    # Compiled images -> heatmaps function; built once per loaded model
+    key = (id(model), layer_name)
+    with _heatmap_fns_lock:
+        if key not in _heatmap_fns:
+            if not hasattr(model, "layers"):
+                raise TypeError("Grad-CAM needs the Keras model; quantized .tflite models have no gradients.")
+            _heatmap_fns[key] = _build_heatmap_fn(model, layer_name)
+        return _heatmap_fns[key]
+
+def compute_heatmaps(model, images, layer_name=None):
+    # (N, h, w) float32 heatmaps in [0, 1] for a normalized float32 batch, one gradient pass
+    return heatmap_fn(model, layer_name)(np.asarray(images, dtype=np.float32)).numpy()
+
+def explain(model, images, model_version="", batch_size=8, time_budget=None, layer_name=None):
+    # Heatmaps for uint8 (N, H, W, 3) images, cached by (model version, image hash).
+    # With a time_budget (seconds), uncached images past the budget are left as None so an
+    # interactive page can show what is ready; later visits pick up the rest.
+    hashes = [content_hash(np.ascontiguousarray(image).tobytes()) for image in images]
+    heatmaps = [heatmap_cache.get(model_version, h) for h in hashes]
+    pending = [i for i, heatmap in enumerate(heatmaps) if heatmap is None]
+
+    start = time.perf_counter()
+    with stage("gradcam", images=len(images), cached=len(images) - len(pending)):
+        for batch_start in range(0, len(pending), batch_size):
+            if time_budget is not None and batch_start and time.perf_counter() - start > time_budget:
+                break
+            chunk = pending[batch_start:batch_start + batch_size]
+            batch = normalize_batch(np.stack([images[i] for i in chunk]))
+            for i, heatmap in zip(chunk, compute_heatmaps(model, batch, layer_name)):
+                heatmaps[i] = heatmap
+                heatmap_cache.put(model_version, hashes[i], heatmap)
+    return heatmaps
+
+def _resize_bilinear(heatmaps, size):
+    # (N, h, w) -> (N, H, W) bilinear upsampling of the whole batch at once (align_corners=False)
+    n, h, w = heatmaps.shape
+    width, height = size
+
+    def axis(out_len, in_len):
+        coords = np.clip((np.arange(out_len) + 0.5) * in_len / out_len - 0.5, 0, in_len - 1)
+        low = np.floor(coords).astype(np.int64)
+        high = np.minimum(low + 1, in_len - 1)
+        return low, high, (coords - low).astype(np.float32)
+
+    y0, y1, fy = axis(height, h)
+    x0, x1, fx = axis(width, w)
+    top = heatmaps[:, y0][:, :, x0] * (1 - fx) + heatmaps[:, y0][:, :, x1] * fx
+    bottom = heatmaps[:, y1][:, :, x0] * (1 - fx) + heatmaps[:, y1][:, :, x1] * fx
+    return top * (1 - fy)[None, :, None] + bottom * fy[None, :, None]
+
+def _jet():
+    global _colormap
+    if _colormap is None:
+        import cv2
+        _colormap = cv2.applyColorMap(np.arange(256, dtype=np.uint8)[:, None], cv2.COLORMAP_JET)[:, 0]
+    return _colormap  # (256, 3) BGR lookup table
+
+def overlay(images, heatmaps, alpha=0.4):
+    # Blends JET-coloured heatmaps onto uint8 BGR images; vectorized over the batch
+    images = np.asarray(images)
+    upsampled = _resize_bilinear(np.stack(heatmaps), (images.shape[2], images.shape[1]))
+    colours = _jet()[np.round(upsampled * 255).astype(np.uint8)]
+    blended = images.astype(np.float32) * (1 - alpha) + colours.astype(np.float32) * alpha
+    return np.clip(blended, 0, 255).astype(np.uint8)
@@ -0,0 +1,223 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.instrumentation import stage
+from utils.preprocessing import IMAGE_EXTENSIONS, preprocess_batch
+from utils.prediction_cache import content_hash, file_hash, prediction_cache
+from utils.study_scoring import score_study
+from utils.tta import predict_tta
+from utils.volume_reader import get_volume, iter_slice_batches
+
+# Shared worker pools: one for model inference, so the Streamlit script thread never
+# blocks on predict, and one for hashing uploaded slices
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="inference")
+_decode_pool = ThreadPoolExecutor(thread_name_prefix="decode")
+
+def preprocess_image(image_path, img_size=(224, 224)):
+    # (1, H, W, 3) float32 batch for a single image
+    return preprocess_batch([image_path], img_size)
+
+def preprocess_images(image_paths, img_size=(224, 224)):
+    # Decoded and resized in parallel into one (N, H, W, 3) float32 batch
+    return preprocess_batch(image_paths, img_size)
+
+def _source_hash(source):
+    return file_hash(source) if isinstance(source, str) else content_hash(bytes(source))
+
+def _cache_version(model_version, tta_views):
+    # Cache key prefix: TTA changes the output, so it is part of the version
+    if model_version is not None and tta_views > 1:
+        return f"{model_version}|tta={tta_views}"
+    return model_version
+
+def _volume_hash(path):
+    # Content hash of a NIfTI file or DICOM series manifest; None (not cached) for a
+    # DICOM directory, whose files can change without the directory itself changing
+    return None if os.path.isdir(path) else file_hash(path)
+
+def predict_images(model, image_paths, batch_size=16, model_version=None, tta_views=1, hashes=None):
+    # Cancer probability per slice; the model sees fixed-size batches instead of N single predicts.
+    # image_paths may also hold in-memory encoded images (bytes), e.g. straight from an upload.
+    # With a model_version, results are cached by image content so repeated scans skip the model;
+    # hashes (SHA-256 of each image, if the caller already has them) skip re-hashing.
+    # tta_views > 1 averages that many augmented views per slice (see utils.tta).
+    model_version = _cache_version(model_version, tta_views)
+    probabilities = np.empty((len(image_paths),), dtype=np.float32)
+    pending = list(range(len(image_paths)))
+
+    if model_version is not None:
+        with stage("cache_lookup", images=len(image_paths)):
+            if hashes is None:
+                hashes = list(_decode_pool.map(_source_hash, image_paths))
+            pending = []
+            for i, image_hash in enumerate(hashes):
+                cached = prediction_cache.get(model_version, image_hash)
+                if cached is None:
+                    pending.append(i)
+                else:
+                    probabilities[i] = cached
+
+    if pending:
+        images = preprocess_images([image_paths[i] for i in pending])
+        with stage("predict", images=len(pending)):
+            probabilities[pending] = predict_tta(model, images, tta_views, batch_size)
+        if model_version is not None:
+            for i in pending:
+                prediction_cache.put(model_version, hashes[i], float(probabilities[i]))
+
+    return probabilities
+
+def predict_image(model, image_path, model_version=None, tta_views=1):
+    # Probability of cancer for a single image
+    return float(predict_images(model, [image_path], model_version=model_version, tta_views=tta_views)[0])
+
+def predict_volume(model, volume_path, batch_size=16, tta_views=1, model_version=None, volume_hash=None):
+    # Per-slice probabilities for a NIfTI file or DICOM series, decoded lazily batch by batch.
+    # With a model_version, slices are cached like images, keyed "<volume hash>#<slice>";
+    # volume_hash (if the caller already has it) skips re-hashing the file.
+    volume = get_volume(volume_path)
+    if model_version is not None and volume_hash is None:
+        volume_hash = _volume_hash(volume_path)
+    probabilities = np.empty((len(volume),), dtype=np.float32)
+    for start in range(0, len(volume), batch_size):
+        indices = list(range(start, min(start + batch_size, len(volume))))
+        probabilities[indices] = predict_volume_slices(model, volume, indices, tta_views, model_version, volume_hash)
+    return probabilities
+
+def predict_volume_slices(model, volume, indices, tta_views=1, model_version=None, volume_hash=None):
+    # Probabilities for selected slices of an already opened volume; only the slices
+    # missing from the prediction cache are decoded
+    indices = list(indices)
+    model_version = _cache_version(model_version, tta_views) if volume_hash is not None else None
+    probabilities = np.empty((len(indices),), dtype=np.float32)
+    pending = list(range(len(indices)))
+    if model_version is not None:
+        pending = []
+        for row, index in enumerate(indices):
+            cached = prediction_cache.get(model_version, f"{volume_hash}#{index}")
+            if cached is None:
+                pending.append(row)
+            else:
+                probabilities[row] = cached
+
+    if pending:
+        _, batch = next(iter_slice_batches(volume, len(pending), [indices[row] for row in pending]))
+        with stage("predict", images=len(pending)):
+            probabilities[pending] = predict_tta(model, batch, tta_views, len(pending) * tta_views)
+        if model_version is not None:
+            for row in pending:
+                prediction_cache.put(model_version, f"{volume_hash}#{indices[row]}", float(probabilities[row]))
+    return probabilities
+
+def predict_study(model, image_paths, volume_paths=(), batch_size=16, model_version=None, tta_views=1,
+                  early_exit=False, image_hashes=None, volume_hashes=None):
+    # Image slices first, then every volume's slices in order (see study_slice_names).
+    # With early_exit, slices are scheduled by utils.study_scoring and the ones never
+    # inferred are NaN; once one part of the study is positive the rest is skipped.
+    volume_paths = list(volume_paths)
+    if volume_hashes is None:
+        volume_hashes = [None] * len(volume_paths)
+    if not early_exit:
+        parts = [predict_images(model, image_paths, batch_size, model_version, tta_views, image_hashes)]
+        parts += [predict_volume(model, path, batch_size, tta_views, model_version, volume_hash)
+                  for path, volume_hash in zip(volume_paths, volume_hashes)]
+        return np.concatenate(parts)
+
+    image_paths = list(image_paths)
+    sources = [(len(image_paths), lambda indices: predict_images(
+        model, [image_paths[i] for i in indices], batch_size, model_version, tta_views,
+        None if image_hashes is None else [image_hashes[i] for i in indices]))]
+    for path, volume_hash in zip(volume_paths, volume_hashes):
+        volume = get_volume(path)
+        if model_version is not None and volume_hash is None:
+            volume_hash = _volume_hash(path)
+        sources.append((len(volume), lambda indices, volume=volume, volume_hash=volume_hash: predict_volume_slices(
+            model, volume, indices, tta_views, model_version, volume_hash)))
+
+    parts, positive = [], False
+    for num_slices, predict_slices in sources:
+        if positive or num_slices == 0:
+            parts.append(np.full((num_slices,), np.nan, dtype=np.float32))
+            continue
+        result = score_study(predict_slices, num_slices, batch_size)
+        parts.append(result["probabilities"])
+        positive = result["cancer_detected"]
+    return np.concatenate(parts)
+
+def load_study_slice(image_paths, volume_paths, index, img_size=(224, 224)):
+    # One slice of a study as a normalized (1, H, W, 3) batch plus an id for it: the image
+    # path, or "<volume>#<slice>". Slices are numbered as in predict_study.
+    if index < len(image_paths):
+        return preprocess_batch([image_paths[index]], img_size), image_paths[index]
+    index -= len(image_paths)
+    for path in volume_paths:
+        volume = get_volume(path)
+        if index < len(volume):
+            _, batch = next(iter_slice_batches(volume, 1, [index], img_size))
+            return batch, f"{path}#{index}"
+        index -= len(volume)
+    raise IndexError("slice index out of range for this study")
+
+def study_slice_names(image_paths, volume_paths=(), image_names=None, volume_names=None):
+    # Display names default to the file names; uploads pass their original names instead
+    names = list(image_names) if image_names is not None else [os.path.basename(path) for path in image_paths]
+    if volume_names is None:
+        volume_names = [os.path.basename(os.path.normpath(path)) for path in volume_paths]
+    for path, volume_name in zip(volume_paths, volume_names):
+        names += [f"{volume_name} #{z + 1}" for z in range(len(get_volume(path)))]
+    return names
+
+def _predict_after_writes(pending_writes, *args):
+    for write in pending_writes:
+        write.result()  # volumes are read from disk, so their upload must have landed
+    return predict_study(*args)
+
+def submit_prediction(model, image_paths, batch_size=16, model_version=None, tta_views=1, volume_paths=(),
+                      early_exit=False, image_hashes=None, pending_writes=(), volume_hashes=None):
+    # Starts inference for a whole study in the background and returns a concurrent.futures.Future.
+    # pending_writes are futures (e.g. upload store writes) to wait for before reading volumes.
+    return _executor.submit(_predict_after_writes, list(pending_writes), model, list(image_paths),
+                            list(volume_paths), batch_size, model_version, tta_views, early_exit, image_hashes,
+                            volume_hashes)
+
+def summarize_study(probabilities, threshold=0.5):
+    # Study-level result: the study is positive if any slice is, scored by its most suspicious slice.
+    # Slices skipped by early exit (NaN) count towards num_slices only. With no inferred slice
+    # (empty or unreadable study) the probabilities are None and nothing is detected.
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    inferred = probabilities[~np.isnan(probabilities)]
+    positive = inferred > threshold
+    return {
+        "num_slices": int(len(probabilities)),
+        "num_inferred": int(len(inferred)),
+        "num_positive": int(positive.sum()),
+        "max_probability": float(inferred.max()) if len(inferred) else None,
+        "mean_probability": float(inferred.mean()) if len(inferred) else None,
+        "cancer_detected": bool(positive.any()),
+    }
+
+MAX_ZIP_MEMBERS = 10000
+MAX_ZIP_BYTES = 2 * 2**30  # total uncompressed size of the members read
+
+def read_zip_members(zip_file, extensions=IMAGE_EXTENSIONS, max_members=MAX_ZIP_MEMBERS, max_bytes=MAX_ZIP_BYTES):
+    # (member path, bytes) of every member of an uploaded zip with the given extensions,
+    # sorted by path; nothing is written to disk. The full path is kept so same-named
+    # slices in different folders stay distinct. Raises ValueError past max_members or
+    # max_bytes (zip bombs); reads are bounded by the declared sizes.
+    with zipfile.ZipFile(zip_file) as archive:
+        members = sorted((info for info in archive.infolist()
+                          if not info.is_dir() and os.path.basename(info.filename).lower().endswith(extensions)),
+                         key=lambda info: info.filename)
+        if len(members) > max_members:
+            raise ValueError(f"Zip has {len(members)} scans, more than the limit of {max_members}")
+        if sum(info.file_size for info in members) > max_bytes:
+            raise ValueError(f"Zip expands to more than {max_bytes / 2**20:.0f} MB")
+        contents = []
+        for info in members:
+            with archive.open(info) as member:
+                data = member.read(info.file_size + 1)
+            if len(data) > info.file_size:
+                raise ValueError(f"Zip member {info.filename} is larger than its declared size")
+            contents.append((info.filename, data))
+        return contents
@@ -0,0 +1,167 @@
+import cProfile
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Per-stage timing for the diagnosis flow and data loading. Every `stage` records wall
+# time and resident-memory change into an in-memory ring buffer (summarized by the app's
+# admin page) and, if PCD_METRICS_LOG is set, appends one JSON line per stage to that file.
+#
+# PCD_PROFILE=cprofile  dumps a cProfile .prof per stage into PCD_PROFILE_DIR (default: profiles/)
+# PCD_PROFILE=tf        captures a TensorFlow profiler trace per stage into PCD_PROFILE_DIR
+
+_records = deque(maxlen=int(os.environ.get("PCD_METRICS_BUFFER", 2000)))
+_lock = threading.Lock()
+_profile_lock = threading.Lock()  # only one profiler session can be active at a time
+
+try:
+    import psutil
+    _process = psutil.Process()
+except ImportError:
+    _process = None
+
+def rss_bytes():
+    if _process is not None:
+        return _process.memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None  # no cheap way to read RSS on this platform
+
+def peak_rss_mb():
+    # VmHWM is this process's own high-water mark; ru_maxrss is inherited from the parent
+    # across fork/exec, so in a spawned measurement process it would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024  # kB
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+def wait_for_child(process, result_queue, timeout=None, poll=1.0):
+    # Result a spawned measurement process put on result_queue. A child that dies without
+    # one (crash, OOM kill) or runs past timeout seconds yields {"error": ...} instead of
+    # blocking forever; the process is joined (terminated on timeout) before returning.
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            result = result_queue.get(timeout=poll)
+            break
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            try:
+                result = result_queue.get(timeout=poll)  # put just before exiting
+            except queue.Empty:
+                result = {"error": f"child process exited with code {process.exitcode} without a result"}
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            result = {"error": f"child process timed out after {timeout:.0f}s"}
+            break
+    process.join()
+    return result
+
+def _profile_path(name, extension):
+    profile_dir = os.environ.get("PCD_PROFILE_DIR", "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    return os.path.join(profile_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}{extension}")
+
+@contextmanager
+def _profiled(name):
+    mode = os.environ.get("PCD_PROFILE", "").lower()
+    if mode not in ("cprofile", "tf") or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(_profile_path(name, ".prof"))
+        else:
+            import tensorflow as tf
+
+            tf.profiler.experimental.start(_profile_path(name, ""))
+            try:
+                yield
+            finally:
+                tf.profiler.experimental.stop()
+    finally:
+        _profile_lock.release()
+
+@contextmanager
+def stage(name, **tags):
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        with _profiled(name):
+            yield
+    finally:
+        rss_after = rss_bytes()
+        record = {
+            "stage": name,
+            "time": time.time(),
+            "seconds": time.perf_counter() - start,
+            "rss_mb": rss_after / 2**20 if rss_after is not None else None,
+            "rss_delta_mb": (rss_after - rss_before) / 2**20 if rss_after is not None else None,
+            "thread": threading.current_thread().name,
+        }
+        record.update(tags)
+        _record(record)
+
+def record(name, seconds, **tags):
+    # A measurement taken outside a `stage` block (e.g. time to first render)
+    rss = rss_bytes()
+    entry = {"stage": name, "time": time.time(), "seconds": seconds,
+             "rss_mb": rss / 2**20 if rss is not None else None, "rss_delta_mb": None,
+             "thread": threading.current_thread().name}
+    entry.update(tags)
+    _record(entry)
+
+def _record(record):
+    with _lock:
+        _records.append(record)
+        log_path = os.environ.get("PCD_METRICS_LOG")
+        if log_path:
+            with open(log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+def recent(limit=100):
+    with _lock:
+        return list(_records)[-limit:]
+
+def summary():
+    # Latency percentiles and memory change per stage over the records still in the buffer
+    with _lock:
+        records = list(_records)
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record["stage"], []).append(record)
+
+    rows = []
+    for name, stage_records in by_stage.items():
+        seconds = np.array([r["seconds"] for r in stage_records]) * 1000
+        deltas = [r["rss_delta_mb"] for r in stage_records if r["rss_delta_mb"] is not None]
+        rows.append({
+            "stage": name,
+            "count": len(stage_records),
+            "p50_ms": float(np.percentile(seconds, 50)),
+            "p95_ms": float(np.percentile(seconds, 95)),
+            "max_ms": float(seconds.max()),
+            "mean_rss_delta_mb": float(np.mean(deltas)) if deltas else None,
+        })
+    return rows
@@ -0,0 +1,103 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+import numpy as np
+
+class MicroBatcher:
+    # Coalesces concurrent single-image requests into dynamic batches. A worker thread
+    # waits for the first queued item, then keeps collecting until max_batch_size items
+    # or max_wait_ms have passed, and runs predict_fn once on the stacked batch.
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, latency_window=10000):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._batch_sizes = Counter()
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image):
+        # image: one preprocessed (H, W, C) float32 array; returns a Future of its output row
+        future = Future()
+        with self._lock:  # close() flips _running under the same lock, so nothing is queued after it
+            if not self._running:
+                future.set_exception(RuntimeError("MicroBatcher is closed"))
+                return future
+            self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def predict(self, image, timeout=None):
+        return self.submit(image).result(timeout)
+
+    def close(self):
+        with self._lock:
+            self._running = False
+        self._queue.put(None)
+        self._worker.join()
+        # Requests still queued behind the sentinel would otherwise never resolve
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("MicroBatcher is closed"))
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                outputs = self.predict_fn(np.stack([image for image, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._latencies.extend(done - enqueued for _, _, enqueued in batch)
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def metrics(self):
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64) * 1000
+            histogram = dict(sorted(self._batch_sizes.items()))
+        requests = int(sum(size * count for size, count in histogram.items()))
+        return {
+            "queue_depth": self._queue.qsize(),
+            "requests": requests,
+            "batches": int(sum(histogram.values())),
+            "mean_batch_size": requests / max(1, sum(histogram.values())),
+            "batch_size_histogram": {str(size): count for size, count in histogram.items()},
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_ms_p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        }
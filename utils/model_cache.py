@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+import numpy as np
+from utils.backends import load_inference_model
+
+# Process-wide model holder. Streamlit re-executes the app script on every interaction,
+# but imported modules persist, so models kept here are loaded once per process and
+# shared by every session.
+_lock = threading.Lock()
+_models = {}
+_stats = {}
+
+def get_model(model_path, input_shape=(224, 224, 3), warmup=True):
+    model = _models.get(model_path)
+    if model is not None:
+        return model
+
+    with _lock:
+        if model_path in _models:  # another thread finished loading while we waited
+            return _models[model_path]
+
+        version = _file_version(model_path)
+        start = time.perf_counter()
+        model = load_inference_model(model_path)  # Keras .h5 or quantized .tflite
+        load_seconds = time.perf_counter() - start
+
+        # A dummy prediction traces the predict graph now, so the first patient doesn't pay for it
+        warmup_seconds = 0.0
+        if warmup:
+            start = time.perf_counter()
+            model.predict(np.zeros((1,) + tuple(input_shape), dtype=np.float32), verbose=0)
+            warmup_seconds = time.perf_counter() - start
+
+        _stats[model_path] = {"version": version, "load_seconds": load_seconds, "warmup_seconds": warmup_seconds,
+                              "loaded_at": time.time()}
+        _models[model_path] = model
+        return model
+
+def is_loaded(model_path):
+    return model_path in _models
+
+def preload(model_path, input_shape=(224, 224, 3)):
+    # Loads the model on a daemon thread (e.g. right after login) so the first inference
+    # doesn't wait for it; a foreground get_model() meanwhile blocks on the same lock.
+    # Load errors are left for that foreground call to report.
+    if model_path in _models:
+        return None
+
+    def run():
+        try:
+            get_model(model_path, input_shape)
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=run, name="model-preload", daemon=True)
+    thread.start()
+    return thread
+
+def _file_version(model_path):
+    stat = os.stat(model_path)
+    return f"{os.path.basename(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def model_version(model_path):
+    # Identifies the weights actually loaded in this process (file name, size, mtime),
+    # used to key cached predictions so a retrained model never serves stale results
+    if model_path in _stats:
+        return _stats[model_path]["version"]
+    return _file_version(model_path)
+
+def model_stats(model_path=None):
+    # Load/warm-up timings for one model, or for all loaded models
+    if model_path is not None:
+        return dict(_stats.get(model_path, {}))
+    return {path: dict(stats) for path, stats in _stats.items()}
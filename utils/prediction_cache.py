@@ -0,0 +1,58 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+def content_hash(data):
+    # Key for an image: hash of the raw file bytes, so renamed or re-uploaded scans still hit
+    return hashlib.sha256(data).hexdigest()
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+class PredictionCache:
+    # Thread-safe LRU of model outputs keyed by (model version, image content hash)
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_version, image_hash):
+        key = (model_version, image_hash)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model_version, image_hash, value):
+        key = (model_version, image_hash)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # evict least recently used
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+# Process-wide cache shared by every Streamlit session
+prediction_cache = PredictionCache()
@@ -0,0 +1,83 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from utils.instrumentation import stage
+
+# Single preprocessing path for training and serving. Images are decoded with OpenCV
+# in BGR order and resized with bilinear interpolation, exactly as the model was
+# trained; batches stay uint8 until one in-place float32 normalization at the end.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+_pool = ThreadPoolExecutor(thread_name_prefix="preprocess")
+
+def decode_image(source):
+    # source: file path, raw encoded bytes, or a binary file-like object (e.g. a Streamlit upload).
+    # IMREAD_COLOR always yields 3 channels: grayscale is expanded and alpha dropped.
+    if isinstance(source, str):
+        return cv2.imread(source, cv2.IMREAD_COLOR)
+    if hasattr(source, "getbuffer"):
+        data = source.getbuffer()
+    elif hasattr(source, "read"):
+        data = source.read()
+    else:
+        data = source
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def load_image(source, img_size=(224, 224)):
+    # Decoded and resized uint8 image, or None if the source can't be decoded
+    img = decode_image(source)
+    if img is None:
+        return None
+    return cv2.resize(img, img_size)
+
+def decode_batches(paths, batch_size, workers=None, prefetch=2, img_size=(224, 224)):
+    # Yields (paths, list of uint8 images or None for undecodable files) with at most
+    # `prefetch` batches decoded ahead of the consumer, so memory stays bounded
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start:start + batch_size]
+            pending.append((chunk, [pool.submit(load_image, p, img_size) for p in chunk]))
+            if len(pending) > prefetch:
+                chunk, futures = pending.popleft()
+                yield chunk, [f.result() for f in futures]
+        while pending:
+            chunk, futures = pending.popleft()
+            yield chunk, [f.result() for f in futures]
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def normalize_batch(batch, out=None):
+    # uint8 -> float32 in [0, 1] in a single pass; no float64 temporaries
+    if out is None:
+        out = np.empty(batch.shape, dtype=np.float32)
+    return np.divide(batch, 255, out=out, dtype=np.float32)
+
+def _describe_source(source, row):
+    # Path, upload name, or "in-memory image #<row> (<type>[, <n> bytes])" for error messages
+    if isinstance(source, str):
+        return source
+    name = getattr(source, "name", None)
+    if isinstance(name, str):
+        return f"{name} (#{row})"
+    size = f", {len(source)} bytes" if isinstance(source, (bytes, bytearray, memoryview)) else ""
+    return f"in-memory image #{row} ({type(source).__name__}{size})"
+
+def preprocess_batch(sources, img_size=(224, 224)):
+    # Decode/resize every source on the pool straight into one preallocated uint8 batch,
+    # then normalize it to float32. Raises ValueError on an undecodable source.
+    batch = np.empty((len(sources), img_size[1], img_size[0], 3), dtype=np.uint8)
+
+    def fill(row):
+        img = load_image(sources[row], img_size)
+        if img is None:
+            raise ValueError(f"Could not decode image {_describe_source(sources[row], row)}")
+        batch[row] = img
+
+    with stage("decode_resize", images=len(sources)):
+        list(_pool.map(fill, range(len(sources))))
+    with stage("normalize", images=len(sources)):
+        return normalize_batch(batch)
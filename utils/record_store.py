@@ -0,0 +1,318 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import numpy as np
+from utils.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# Persistent patient / scan / prediction records in a local SQLite file (WAL mode, so the
+# history page reads while the writer commits). Writes are queued and committed by one
+# background thread in batched transactions; ids are generated up front, so the pages
+# that record something never wait for the disk. History queries page with a keyset
+# cursor over (created_at, rowid) rather than OFFSET, so page 1000 costs the same as
+# page 1, and every filter (patient, outcome, date) is served by an index.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    age INTEGER,
+    gender TEXT,
+    blood_group TEXT,
+    height_cm REAL,
+    weight_kg REAL,
+    smoking TEXT,
+    family_history TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS patients_name ON patients (name COLLATE NOCASE, created_at);
+
+CREATE TABLE IF NOT EXISTS scans (
+    study_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT,
+    digest TEXT,
+    path TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (study_id, position)
+);
+CREATE INDEX IF NOT EXISTS scans_digest ON scans (digest);
+
+CREATE TABLE IF NOT EXISTS predictions (
+    study_id TEXT PRIMARY KEY,
+    patient_id TEXT,
+    created_at REAL NOT NULL,
+    model_version TEXT,
+    outcome INTEGER NOT NULL,
+    max_probability REAL,
+    mean_probability REAL,
+    num_slices INTEGER,
+    num_inferred INTEGER,
+    num_positive INTEGER,
+    probabilities BLOB
+);
+CREATE INDEX IF NOT EXISTS predictions_date ON predictions (created_at);
+CREATE INDEX IF NOT EXISTS predictions_patient ON predictions (patient_id, created_at);
+CREATE INDEX IF NOT EXISTS predictions_outcome ON predictions (outcome, created_at);
+"""
+
+INSERT_PATIENT = """INSERT OR REPLACE INTO patients (patient_id, name, age, gender, blood_group, height_cm,
+    weight_kg, smoking, family_history, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+INSERT_SCAN = """INSERT OR REPLACE INTO scans (study_id, position, kind, name, digest, path, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+INSERT_PREDICTION = """INSERT OR REPLACE INTO predictions (study_id, patient_id, created_at, model_version,
+    outcome, max_probability, mean_probability, num_slices, num_inferred, num_positive, probabilities)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# "image": a JPG/PNG slice, "volume": a NIfTI file or DICOM series manifest,
+# "dicom": one DICOM file of a series (the series itself is also recorded as a "volume")
+SCAN_KINDS = ("image", "volume", "dicom")
+
+HISTORY_COLUMNS = ("study_id", "created_at", "patient_id", "name", "age", "gender", "outcome", "max_probability",
+                   "num_slices", "num_positive", "model_version")
+
+def new_id():
+    return uuid.uuid4().hex
+
+def _describe(sql, params):
+    # "<table> <first key>" for log messages, without the row's contents
+    return f"{sql.split('INTO ', 1)[1].split(' ', 1)[0]} {params[0]}"
+
+class RecordStore:
+    def __init__(self, path, batch_size=500, flush_interval=0.2):
+        self.path = path
+        self.batch_size = batch_size  # statements per transaction at most
+        self.flush_interval = flush_interval  # how long the writer waits to fill a batch
+        self._queue = queue.Queue()
+        self._local = threading.local()  # one read connection per thread (Streamlit session threads)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._generation = 0  # bumped whenever predictions are written; invalidates _counts
+        self._counts = {}  # filters -> (generation, count)
+        self.stats = {"queued": 0, "written": 0, "transactions": 0, "failed": 0, "last_error": None}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; WAL keeps the file consistent
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.row_factory = sqlite3.Row
+        return conn
+
+    # ---- writes: queued, committed in batches by the writer thread ----
+
+    def _submit(self, sql, params):
+        self._start_writer()
+        with self._lock:
+            self.stats["queued"] += 1
+        self._queue.put((sql, params))
+
+    def add_patient(self, details, patient_id=None, created_at=None):
+        # details as collected by the patient form; returns the id immediately
+        patient_id = patient_id or new_id()
+        self._submit(INSERT_PATIENT, (
+            patient_id, details.get("Name", ""), details.get("Age"), details.get("Gender"),
+            details.get("Blood Group"), details.get("Height"), details.get("Weight"), details.get("Smoking"),
+            details.get("Family History"), time.time() if created_at is None else created_at))
+        return patient_id
+
+    def add_scans(self, study_id, scans, created_at=None):
+        # scans: dicts with kind (one of SCAN_KINDS), name, digest and path, in study order
+        created_at = time.time() if created_at is None else created_at
+        for position, scan in enumerate(scans):
+            if scan["kind"] not in SCAN_KINDS:
+                raise ValueError(f"Unknown scan kind {scan['kind']!r}, expected one of {SCAN_KINDS}")
+            self._submit(INSERT_SCAN, (study_id, position, scan["kind"], scan.get("name"), scan.get("digest"),
+                                       scan.get("path"), created_at))
+
+    def add_prediction(self, study_id, patient_id, study, probabilities, model_version="", created_at=None):
+        # study: summarize_study() output; per-slice probabilities are kept as a float32 blob (NaN = not inferred)
+        self._submit(INSERT_PREDICTION, (
+            study_id, patient_id, time.time() if created_at is None else created_at, model_version,
+            int(study["cancer_detected"]), study["max_probability"], study["mean_probability"],
+            study["num_slices"], study["num_inferred"], study["num_positive"],
+            np.asarray(probabilities, dtype=np.float32).tobytes()))
+
+    def flush(self, timeout=None):
+        # Blocks until everything queued so far is committed; True if it was in time
+        done = threading.Event()
+        self._start_writer()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_loop, name="record-write", daemon=True)
+            self._writer.start()
+        # The writer is a daemon thread; commit whatever is still queued when the process exits
+        atexit.register(self.flush, 10)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            statements = [item for item in batch if item[0] is not None]
+            try:
+                self._write(conn, statements)
+            except Exception as e:  # never let the writer die, or flush() would wait forever
+                logger.exception("Record writer dropped a batch of %d record(s)", len(statements))
+                with self._lock:
+                    self.stats["failed"] += len(statements)
+                    self.stats["last_error"] = repr(e)
+            for sql, done in batch:
+                if sql is None:
+                    done.set()
+
+    def _write(self, conn, batch):
+        if not batch:
+            return
+        # Consecutive statements of the same kind go through one executemany
+        groups = []
+        for sql, params in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        try:
+            with stage("record_write", rows=len(batch)), conn:  # one transaction per batch
+                for sql, rows in groups:
+                    conn.executemany(sql, rows)
+            self._written(batch, transactions=1)
+            return
+        except Exception as e:
+            logger.warning("Batch of %d record(s) failed (%r); retrying one by one", len(batch), e)
+
+        # One bad row (or a transient error) must not lose the whole batch: each statement
+        # gets its own transaction, and only the ones that still fail are dropped
+        written = []
+        for sql, params in batch:
+            try:
+                with conn:
+                    conn.execute(sql, params)
+                written.append((sql, params))
+            except Exception as e:
+                logger.error("Dropped record %s: %r", _describe(sql, params), e)
+                with self._lock:
+                    self.stats["failed"] += 1
+                    self.stats["last_error"] = repr(e)
+        self._written(written, transactions=len(written))
+
+    def _written(self, batch, transactions):
+        with self._lock:
+            self.stats["written"] += len(batch)
+            self.stats["transactions"] += transactions
+            if any(sql == INSERT_PREDICTION for sql, _ in batch):
+                self._generation += 1
+
+    # ---- reads ----
+
+    def _where(self, patient_id=None, name=None, outcome=None, since=None, until=None):
+        clauses, params = [], []
+        if patient_id is not None:
+            clauses.append("p.patient_id = ?")
+            params.append(patient_id)
+        if name:
+            clauses.append("p.patient_id IN (SELECT patient_id FROM patients WHERE name = ? COLLATE NOCASE)")
+            params.append(name)
+        if outcome is not None:
+            # With a patient filter the unary + keeps the planner on predictions_patient;
+            # otherwise it scans predictions_outcome (~30% of the table) for a few rows
+            clauses.append("+p.outcome = ?" if patient_id is not None or name else "p.outcome = ?")
+            params.append(int(outcome))
+        if since is not None:
+            clauses.append("p.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("p.created_at < ?")
+            params.append(until)
+        return clauses, params
+
+    def history(self, limit=50, cursor=None, **filters):
+        # Newest first. Returns (rows, next_cursor); pass next_cursor back for the following
+        # page, None means there is none. filters: patient_id, name, outcome, since, until.
+        clauses, params = self._where(**filters)
+        if cursor is not None:
+            clauses.append("(p.created_at, p.rowid) < (?, ?)")
+            params += list(cursor)
+        sql = f"""SELECT p.rowid AS row_id, p.study_id, p.created_at, p.patient_id, pt.name, pt.age, pt.gender,
+                         p.outcome, p.max_probability, p.num_slices, p.num_positive, p.model_version
+                  FROM predictions p LEFT JOIN patients pt ON pt.patient_id = p.patient_id
+                  {"WHERE " + " AND ".join(clauses) if clauses else ""}
+                  ORDER BY p.created_at DESC, p.rowid DESC LIMIT ?"""
+        with stage("record_history", limit=limit):
+            rows = self._reader().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = (rows[limit - 1]["created_at"], rows[limit - 1]["row_id"]) if len(rows) > limit else None
+        return [{column: row[column] for column in HISTORY_COLUMNS} for row in rows[:limit]], next_cursor
+
+    def count(self, **filters):
+        # Cached per filter until the writer commits another prediction, so paging through
+        # history doesn't re-count the table on every rerun
+        key = tuple(sorted(filters.items()))
+        with self._lock:
+            generation = self._generation
+            cached = self._counts.get(key)
+        if cached is not None and cached[0] == generation:
+            return cached[1]
+        clauses, params = self._where(**filters)
+        sql = f"SELECT COUNT(*) FROM predictions p {'WHERE ' + ' AND '.join(clauses) if clauses else ''}"
+        total = self._reader().execute(sql, params).fetchone()[0]
+        with self._lock:
+            self._counts[key] = (generation, total)
+        return total
+
+    def patient(self, patient_id):
+        row = self._reader().execute("SELECT * FROM patients WHERE patient_id = ?", (patient_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def study(self, study_id):
+        # One prediction with its per-slice probabilities and uploaded scans
+        conn = self._reader()
+        row = conn.execute("SELECT * FROM predictions WHERE study_id = ?", (study_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["probabilities"] = np.frombuffer(record["probabilities"] or b"", dtype=np.float32)
+        record["scans"] = [dict(scan) for scan in conn.execute(
+            "SELECT kind, name, digest, path FROM scans WHERE study_id = ? ORDER BY position", (study_id,))]
+        return record
+
+    def usage(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(pending_writes=self._queue.qsize(), path=self.path,
+                     bytes=sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal")
+                               if os.path.exists(self.path + suffix)))
+        return stats
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_record_store(path):
+    # Process-wide store per database file, shared by every Streamlit session
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = RecordStore(path)
+        return _stores[path]
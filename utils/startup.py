@@ -0,0 +1,45 @@
+import base64
+import os
+import threading
+import time
+from functools import lru_cache
+from utils.instrumentation import record
+
+# Cold-start helpers for the Streamlit apps. Streamlit re-executes the whole script on
+# every interaction, so anything computed at script level is paid on every rerun; work
+# kept here runs once per process instead.
+
+_started = time.perf_counter()  # first import, i.e. the first script run in this process
+_first_render_lock = threading.Lock()
+_first_render = {}
+
+@lru_cache(maxsize=None)
+def background_css(image_file):
+    # <style> block with the image inlined as base64; read and encoded once per process.
+    # A missing image just leaves the default background.
+    if not os.path.exists(image_file):
+        return ""
+    with open(image_file, "rb") as f:
+        encoded_string = base64.b64encode(f.read()).decode()
+    return f"""
+    <style>
+    .stApp {{
+        background-image: url("data:image/jpg;base64,{encoded_string}");
+        background-size: cover;
+        background-position: center;
+        background-repeat: no-repeat;
+    }}
+    </style>
+    """
+
+def mark_first_render(app, page):
+    # Records time from the first script run to the end of the first rendered page, once per app
+    with _first_render_lock:
+        if app in _first_render:
+            return
+        _first_render[app] = time.perf_counter() - _started
+    record("first_render", _first_render[app], app=app, page=page)
+
+def first_render_seconds(app=None):
+    with _first_render_lock:
+        return _first_render.get(app) if app is not None else dict(_first_render)
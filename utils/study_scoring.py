@@ -0,0 +1,104 @@
+import numpy as np
+from utils.instrumentation import stage
+
+# Early-exit scoring for whole CT studies. Most slices of a study are far from the
+# pancreas and carry no signal, so instead of predicting every slice the scheduler
+# samples the z-axis coarse-to-fine (middle slice, then quarters, eighths, ...) until
+# scored slices are at most `max_gap` apart, then refines only the gaps next to
+# suspicious slices. Scoring stops as soon as the study decision is settled:
+#   - positive: the study is scored by its most suspicious slice (see summarize_study),
+#     so once `min_positive` slices are above the threshold no further slice can flip it;
+#   - negative: the coarse pass is complete and every unscored slice sits between scored
+#     neighbours below `negative_threshold`.
+# Unscored slices are reported as NaN.
+
+def coarse_to_fine_order(num_slices, min_stride=1):
+    # Every index once, sampled at halving strides: n/2, then n/4 and 3n/4, and so on.
+    # With min_stride > 1 only the levels down to that stride are returned, i.e. the
+    # returned slices are min_stride / 2 apart.
+    order = []
+    stride = 1 << max(num_slices - 1, 0).bit_length()
+    seen = np.zeros(num_slices, dtype=bool)
+    while stride >= max(min_stride, 1):
+        for z in range(stride // 2, num_slices, stride):
+            if not seen[z]:
+                seen[z] = True
+                order.append(z)
+        stride //= 2
+    return order
+
+class StudyScheduler:
+    def __init__(self, num_slices, threshold=0.5, negative_threshold=0.25, max_gap=4, min_positive=1):
+        self.num_slices = num_slices
+        self.threshold = threshold
+        self.negative_threshold = negative_threshold
+        self.min_positive = min_positive
+        self.probabilities = np.full((num_slices,), np.nan, dtype=np.float32)
+        self._coarse = coarse_to_fine_order(num_slices, 2 * max_gap)
+        self._rank = np.empty((num_slices,), dtype=np.int64)  # tie-break: larger gaps first
+        self._rank[coarse_to_fine_order(num_slices)] = np.arange(num_slices)
+
+    @property
+    def scored(self):
+        return ~np.isnan(self.probabilities)
+
+    @property
+    def num_inferred(self):
+        return int(self.scored.sum())
+
+    @property
+    def positive(self):
+        return int((self.probabilities > self.threshold).sum()) >= self.min_positive
+
+    def _neighbour_priority(self):
+        # Probability of the more suspicious of the nearest scored slices on either side
+        scored = self.scored
+        positions = np.arange(self.num_slices)
+        left = np.maximum.accumulate(np.where(scored, positions, -1))
+        right = np.minimum.accumulate(np.where(scored, positions, self.num_slices)[::-1])[::-1]
+        padded = np.append(np.nan_to_num(self.probabilities, nan=-1.0), -1.0)  # index -1 / n → -1
+        priority = np.maximum(padded[left], padded[right])
+        priority[scored] = -1.0
+        return priority
+
+    def next_batch(self, batch_size):
+        # Next slices to infer; empty once the study is decided
+        if self.positive:
+            return []
+        scored = self.scored
+        coarse = [z for z in self._coarse if not scored[z]]
+        if coarse:
+            return coarse[:batch_size]
+
+        priority = self._neighbour_priority()
+        candidates = np.flatnonzero(priority >= self.negative_threshold)
+        order = np.lexsort((self._rank[candidates], -priority[candidates]))
+        return [int(z) for z in candidates[order[:batch_size]]]
+
+    def update(self, indices, probabilities):
+        self.probabilities[list(indices)] = probabilities
+
+def score_study(predict_slices, num_slices, batch_size=16, threshold=0.5, negative_threshold=0.25,
+                max_gap=4, min_positive=1, min_slices=16):
+    # predict_slices(indices) -> probabilities for those slices. Studies shorter than
+    # min_slices are scored exhaustively, so a handful of uploaded images all get a result.
+    scheduler = StudyScheduler(num_slices, threshold, negative_threshold, max_gap, min_positive)
+    with stage("study_scoring", slices=num_slices):
+        if num_slices < min_slices:
+            for start in range(0, num_slices, batch_size):
+                indices = list(range(start, min(start + batch_size, num_slices)))
+                scheduler.update(indices, predict_slices(indices))
+        else:
+            while True:
+                indices = scheduler.next_batch(batch_size)
+                if not indices:
+                    break
+                scheduler.update(indices, predict_slices(indices))
+
+    return {
+        "probabilities": scheduler.probabilities,
+        "num_slices": num_slices,
+        "num_inferred": scheduler.num_inferred,
+        "early_exit": scheduler.num_inferred < num_slices,
+        "cancer_detected": scheduler.positive,
+    }
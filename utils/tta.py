@@ -0,0 +1,72 @@
+from functools import lru_cache
+import numpy as np
+
+# Test-time augmentation. All K views of every image are built with NumPy indexing into
+# one preallocated (N * K, H, W, 3) batch and scored with a single predict call; the
+# per-image probability is the mean over its views. Views are applied in a fixed order,
+# so K trades accuracy for latency predictably (K=1 is the plain prediction).
+
+SHIFT_PIXELS = 8
+ROTATION_DEGREES = 5.0
+INTENSITY_SCALE = 0.1
+
+@lru_cache(maxsize=8)
+def _rotation_map(height, width, degrees):
+    # Nearest-neighbour source coordinates for rotating about the image centre
+    theta = np.deg2rad(degrees)
+    cy, cx = (height - 1) / 2.0, (width - 1) / 2.0
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    src_x = np.cos(theta) * (x - cx) + np.sin(theta) * (y - cy) + cx
+    src_y = -np.sin(theta) * (x - cx) + np.cos(theta) * (y - cy) + cy
+    valid = (src_x >= 0) & (src_x <= width - 1) & (src_y >= 0) & (src_y <= height - 1)
+    src_x = np.clip(np.rint(src_x), 0, width - 1).astype(np.intp)
+    src_y = np.clip(np.rint(src_y), 0, height - 1).astype(np.intp)
+    return src_y, src_x, valid
+
+def _rotate(images, out, degrees):
+    src_y, src_x, valid = _rotation_map(images.shape[1], images.shape[2], degrees)
+    out[:] = images[:, src_y, src_x]
+    out[:, ~valid] = 0
+
+def _shift(images, out, dx):
+    out[:] = 0
+    if dx > 0:
+        out[:, :, dx:] = images[:, :, :-dx]
+    else:
+        out[:, :, :dx] = images[:, :, -dx:]
+
+def _intensity(images, out, scale):
+    np.multiply(images, np.float32(scale), out=out)
+    np.clip(out, 0.0, 1.0, out=out)
+
+# (name, fn(images, out)) in the order views are added as K grows
+VIEWS = (
+    ("identity", lambda images, out: np.copyto(out, images)),
+    ("hflip", lambda images, out: np.copyto(out, images[:, :, ::-1])),
+    ("rotate+", lambda images, out: _rotate(images, out, ROTATION_DEGREES)),
+    ("rotate-", lambda images, out: _rotate(images, out, -ROTATION_DEGREES)),
+    ("shift+", lambda images, out: _shift(images, out, SHIFT_PIXELS)),
+    ("shift-", lambda images, out: _shift(images, out, -SHIFT_PIXELS)),
+    ("brighter", lambda images, out: _intensity(images, out, 1 + INTENSITY_SCALE)),
+    ("darker", lambda images, out: _intensity(images, out, 1 - INTENSITY_SCALE)),
+    ("vflip", lambda images, out: np.copyto(out, images[:, ::-1])),
+)
+MAX_VIEWS = len(VIEWS)
+
+def augment_batch(images, num_views):
+    # images: (N, H, W, 3) float32 in [0, 1] -> (N * num_views, H, W, 3), views of an image adjacent
+    if not 1 <= num_views <= MAX_VIEWS:
+        raise ValueError(f"num_views must be between 1 and {MAX_VIEWS}, got {num_views}")
+    images = np.asarray(images, dtype=np.float32)
+    views = np.empty((len(images), num_views) + images.shape[1:], dtype=np.float32)
+    for v, (_, fn) in enumerate(VIEWS[:num_views]):
+        fn(images, views[:, v])
+    return views.reshape((-1,) + images.shape[1:])
+
+def predict_tta(model, images, num_views, batch_size=32):
+    # Mean probability over num_views augmented views, from one batched predict call
+    if num_views <= 1:
+        return np.asarray(model.predict(images, batch_size=batch_size, verbose=0))[:, 0]
+    views = augment_batch(images, num_views)
+    probabilities = np.asarray(model.predict(views, batch_size=batch_size, verbose=0))[:, 0]
+    return probabilities.reshape(len(images), num_views).mean(axis=1)
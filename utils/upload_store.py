@@ -0,0 +1,193 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.instrumentation import stage
+from utils.prediction_cache import content_hash
+
+# Content-addressed store for uploaded scans. A blob is named by the SHA-256 of its bytes
+# (the same key the prediction cache uses), so identical scans from different patients
+# are stored once and same-named files from concurrent sessions can't collide. Writes run
+# on a small thread pool; callers keep the in-memory bytes for preprocessing and only wait
+# for the file when something must read it from disk (volumes, the result page). A
+# background thread evicts blobs older than max_age_seconds, then the least recently used
+# ones until the store is under max_bytes. Blobs of studies still being processed are
+# pinned and skipped by eviction.
+
+TMP_SUFFIX = ".tmp"
+PIN_SECONDS = 3600  # a pin not released by unpin() lapses after this long
+
+class StoredBlob:
+    def __init__(self, digest, path, data, write):
+        self.digest = digest
+        self.path = path
+        self.data = data  # the uploaded bytes, handed straight to preprocessing
+        self.write = write  # Future resolved once path exists on disk
+
+    def wait(self):
+        self.write.result()
+        return self.path
+
+class UploadStore:
+    def __init__(self, root, max_bytes=2 * 2**30, max_age_seconds=30 * 86400, eviction_interval=600,
+                 writer_threads=2):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.eviction_interval = eviction_interval
+        self._writer = ThreadPoolExecutor(max_workers=writer_threads, thread_name_prefix="upload-write")
+        self._pending = {}  # path -> Future of an in-flight write
+        self._lock = threading.Lock()
+        self._evictor = None
+        self._pins = {}  # token -> (digests, expiry)
+        self._pin_tokens = itertools.count(1)
+        self.stats = {"puts": 0, "deduplicated": 0, "bytes_written": 0, "evicted": 0, "bytes_evicted": 0}
+
+    def blob_path(self, digest, extension=""):
+        return os.path.join(self.root, digest[:2], digest + extension.lower())
+
+    def put(self, data, extension="", pin=None):
+        # Returns immediately; the write (if the blob is new) runs on the writer pool.
+        # pin: a token from pin(); the blob joins it under the same lock eviction checks,
+        # so a deduplicated blob can't be evicted between put() and its caller using it.
+        self._start_evictor()
+        data = bytes(data)
+        digest = content_hash(data)
+        path = self.blob_path(digest, extension)
+        with self._lock:
+            self.stats["puts"] += 1
+            if pin in self._pins:
+                self._pins[pin][0].add(digest)
+            write = self._pending.get(path)
+            if write is None:
+                try:
+                    os.utime(path)  # refresh for retention
+                    self.stats["deduplicated"] += 1
+                    write = Future()
+                    write.set_result(path)
+                except FileNotFoundError:  # new, or evicted since it was last seen
+                    write = self._writer.submit(self._write, path, data)
+                    self._pending[path] = write
+            else:
+                self.stats["deduplicated"] += 1
+        return StoredBlob(digest, path, data, write)
+
+    def pin(self, digests=(), seconds=PIN_SECONDS):
+        # Keeps these blobs (and any later put(..., pin=token)) from being evicted until
+        # unpin(token) or `seconds` pass; returns the token
+        with self._lock:
+            token = next(self._pin_tokens)
+            self._pins[token] = (set(digests), time.time() + seconds)
+        return token
+
+    def unpin(self, token):
+        with self._lock:
+            self._pins.pop(token, None)
+
+    def _is_pinned(self, digest, now):
+        # Caller holds self._lock
+        for token, (digests, expiry) in list(self._pins.items()):
+            if expiry < now:
+                del self._pins[token]
+            elif digest in digests:
+                return True
+        return False
+
+    def put_text(self, text, extension, pin=None):
+        # Small derived objects (e.g. DICOM series manifests), content-addressed like blobs
+        return self.put(text.encode("utf-8"), extension, pin)
+
+    def _write(self, path, data):
+        try:
+            with stage("upload_write", bytes=len(data)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}{TMP_SUFFIX}"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)  # readers never see a partial blob
+            with self._lock:
+                self.stats["bytes_written"] += len(data)
+            return path
+        finally:
+            with self._lock:
+                self._pending.pop(path, None)
+
+    def _start_evictor(self):
+        with self._lock:
+            if self._evictor is not None:
+                return
+            self._evictor = threading.Thread(target=self._evict_loop, name="upload-evict", daemon=True)
+            self._evictor.start()
+
+    def _evict_loop(self):
+        while True:
+            try:
+                self.evict()
+            except OSError:
+                pass  # a file vanished mid-scan; the next pass catches up
+            time.sleep(self.eviction_interval)
+
+    def _scan(self):
+        blobs = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def evict(self, now=None):
+        # One retention pass; returns the number of files removed
+        now = time.time() if now is None else now
+        blobs = sorted(self._scan())  # oldest first
+        total = sum(size for _, size, _ in blobs)
+        removed = 0
+        for mtime, size, path in blobs:
+            expired = now - mtime > self.max_age_seconds
+            if not expired and total <= self.max_bytes:
+                break
+            if path.endswith(TMP_SUFFIX) and not expired:
+                continue
+            # Checked and removed under the lock put() holds, against the current state
+            # rather than the scan: skip blobs being written, pinned, or touched since
+            with self._lock:
+                try:
+                    if path in self._pending or self._is_pinned(os.path.basename(path).split(".")[0], time.time()) \
+                            or os.stat(path).st_mtime != mtime:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self.stats["evicted"] += 1
+                self.stats["bytes_evicted"] += size
+            total -= size
+            removed += 1
+        return removed
+
+    def usage(self):
+        blobs = self._scan()
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(files=len(blobs), bytes=sum(size for _, size, _ in blobs), max_bytes=self.max_bytes,
+                     max_age_seconds=self.max_age_seconds, pending_writes=len(self._pending), pins=len(self._pins))
+        return stats
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_upload_store(root, max_bytes=2 * 2**30, max_age_seconds=30 * 86400):
+    # Process-wide store per root, shared by every Streamlit session
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = UploadStore(root, max_bytes, max_age_seconds)
+        return _stores[root]
+
+def get_configured_upload_store(root):
+    # get_upload_store with the limits from PCD_UPLOAD_MAX_MB (default 2048) and
+    # PCD_UPLOAD_MAX_AGE_DAYS (default 30), so every app sharing a root uses the same ones
+    return get_upload_store(root, max_bytes=int(os.environ.get("PCD_UPLOAD_MAX_MB", 2048)) * 2**20,
+                            max_age_seconds=float(os.environ.get("PCD_UPLOAD_MAX_AGE_DAYS", 30)) * 86400)
@@ -0,0 +1,142 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from utils.preprocessing import normalize_batch
+
+# CT volumes (NIfTI files or DICOM series) read lazily, one slice at a time. Slices are
+# converted to Hounsfield units, windowed for the pancreas (soft-tissue abdominal window),
+# replicated to 3 channels and resized for the 224x224x3 model, without writing JPEGs.
+#
+# nibabel (NIfTI) and pydicom (DICOM) are only needed for the format actually opened.
+
+PANCREAS_WINDOW = (40, 400)  # (level, width) in HU
+NIFTI_EXTENSIONS = (".nii", ".nii.gz")
+DICOM_EXTENSIONS = (".dcm",)
+DICOM_SERIES_EXTENSION = ".dcmseries"  # text manifest, one DICOM file path per line
+
+MAX_OPEN_VOLUMES = 8  # parsed volumes kept by get_volume
+
+_pool = ThreadPoolExecutor(thread_name_prefix="volume")
+_volumes = OrderedDict()
+_volumes_lock = threading.Lock()
+
+def window_hu(hu, level=PANCREAS_WINDOW[0], width=PANCREAS_WINDOW[1]):
+    # HU -> uint8 grey levels, clipping everything outside [level - width/2, level + width/2]
+    low = level - width / 2.0
+    scaled = (np.asarray(hu, dtype=np.float32) - low) * (255.0 / width)
+    return np.clip(scaled, 0, 255, out=scaled).astype(np.uint8)
+
+class NiftiVolume:
+    def __init__(self, path):
+        try:
+            import nibabel as nib
+        except ImportError as e:
+            raise ImportError("Reading NIfTI volumes requires nibabel (pip install nibabel)") from e
+
+        self.path = path
+        # mmap=True keeps uncompressed volumes on disk; dataobj slicing reads one slice and
+        # applies the scl_slope/scl_inter scaling to HU
+        self._proxy = nib.load(path, mmap=True).dataobj
+        if len(self._proxy.shape) < 3:
+            raise ValueError(f"{path} is not a 3D volume (shape {self._proxy.shape})")
+
+    def __len__(self):
+        return self._proxy.shape[2]
+
+    def hu_slice(self, index):
+        data = np.asarray(self._proxy[:, :, index], dtype=np.float32)
+        while data.ndim > 2:  # 4D series: first time point
+            data = data[..., 0]
+        return data.T[::-1]  # voxel (x, y) -> image rows/cols in radiological orientation
+
+class DicomSeries:
+    def __init__(self, path):
+        try:
+            import pydicom
+        except ImportError as e:
+            raise ImportError("Reading DICOM series requires pydicom (pip install pydicom)") from e
+
+        self._pydicom = pydicom
+        self.path = path
+        if isinstance(path, (list, tuple)):
+            files = list(path)
+        elif path.lower().endswith(DICOM_SERIES_EXTENSION):
+            with open(path) as f:
+                files = [line.strip() for line in f if line.strip()]
+        else:
+            files = [
+                os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                if name.lower().endswith(DICOM_EXTENSIONS)
+            ]
+        if not files:
+            raise ValueError(f"No DICOM files found in {path}")
+
+        # Only headers are read up front; pixel data is decoded when a slice is requested
+        headers = [(f, pydicom.dcmread(f, stop_before_pixels=True)) for f in files]
+        headers.sort(key=lambda item: self._position(item[1]))
+        self.files = [f for f, _ in headers]
+
+    @staticmethod
+    def _position(header):
+        position = getattr(header, "ImagePositionPatient", None)
+        if position is not None:
+            return float(position[2])
+        return float(getattr(header, "InstanceNumber", 0))
+
+    def __len__(self):
+        return len(self.files)
+
+    def hu_slice(self, index):
+        dataset = self._pydicom.dcmread(self.files[index])
+        slope = float(getattr(dataset, "RescaleSlope", 1))
+        intercept = float(getattr(dataset, "RescaleIntercept", 0))
+        return dataset.pixel_array.astype(np.float32) * slope + intercept
+
+def is_volume_path(path):
+    name = path.lower()
+    return name.endswith(NIFTI_EXTENSIONS + (DICOM_SERIES_EXTENSION,)) or (
+        os.path.isdir(path) and any(f.lower().endswith(DICOM_EXTENSIONS) for f in os.listdir(path))
+    )
+
+def open_volume(path):
+    if path.lower().endswith(NIFTI_EXTENSIONS):
+        return NiftiVolume(path)
+    return DicomSeries(path)
+
+def get_volume(path):
+    # open_volume through a small LRU keyed by (path, mtime): a study's volume is parsed
+    # once (DICOM headers, NIfTI header) and shared by inference, slice naming and the
+    # result page instead of being reopened by each
+    key = (path, os.path.getmtime(path))
+    with _volumes_lock:
+        if key in _volumes:
+            _volumes.move_to_end(key)
+            return _volumes[key]
+    volume = open_volume(path)  # outside the lock; a concurrent duplicate open is harmless
+    with _volumes_lock:
+        _volumes[key] = volume
+        _volumes.move_to_end(key)
+        while len(_volumes) > MAX_OPEN_VOLUMES:
+            _volumes.popitem(last=False)
+    return volume
+
+def slice_image(volume, index, img_size=(224, 224), window=PANCREAS_WINDOW):
+    # One slice as a uint8 (H, W, 3) image, matching what the model sees for JPEG slices
+    grey = cv2.resize(window_hu(volume.hu_slice(index), *window), img_size)
+    return np.repeat(grey[:, :, np.newaxis], 3, axis=2)
+
+def iter_slice_batches(volume, batch_size=16, indices=None, img_size=(224, 224), window=PANCREAS_WINDOW):
+    # Yields (slice indices, normalized float32 batch); only one batch of slices is in memory
+    indices = list(range(len(volume))) if indices is None else list(indices)
+    for start in range(0, len(indices), batch_size):
+        chunk = indices[start:start + batch_size]
+        batch = np.empty((len(chunk), img_size[1], img_size[0], 3), dtype=np.uint8)
+
+        def fill(row):
+            batch[row] = slice_image(volume, chunk[row], img_size, window)
+
+        list(_pool.map(fill, range(len(chunk))))
+        yield chunk, normalize_batch(batch)